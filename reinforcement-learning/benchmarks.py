@@ -0,0 +1,312 @@
+"""
+Benchmarks for the agents and data structures in this project.
+
+Run with the name of a benchmark, e.g.
+
+    python benchmarks.py counters
+"""
+import random
+import sys
+import time
+
+import gridworld
+import layout
+import main
+import qlearningAgents
+import util
+from core import GameState
+
+
+class MaterializingQTable(util.Counter):
+    """Q-table with the old behaviour: every read stores a zero entry."""
+
+    def getQValue(self, state, action):
+        return self[(state, action)]
+
+    def setQValue(self, state, action, value):
+        self[(state, action)] = value
+
+
+class StepBudgetExceeded(Exception):
+    pass
+
+
+def readArgs(argv, seed=None, prepareAgent=None):
+    """
+    The runGames args of the main.py command argv, played with seed if
+    given.  prepareAgent, if given, may modify the agent before the first
+    game.
+    """
+    args = main.readCommand(argv, seed, seeds=1)
+    del args['seeds']
+    if prepareAgent is not None:
+        prepareAgent(args['agent'])
+    return args
+
+
+def runQuietGames(argv, prepareAgent=None):
+    """
+    Plays the games main.py would for argv with all output muted.
+    """
+    args = readArgs(argv, prepareAgent=prepareAgent)
+    util.mutePrint()
+    try:
+        main.runGames(**args)
+    finally:
+        util.unmutePrint()
+    return args['agent']
+
+
+def countCalls(agent, method, limit=None):
+    """
+    Wraps the method of agent with the given name so that every call
+    appends to the returned list.  With a limit, the call after limit
+    calls raises StepBudgetExceeded instead.
+    """
+    calls = []
+    call = getattr(agent, method)
+
+    def countingCall(*args):
+        calls.append(1)
+        if limit is not None and len(calls) > limit:
+            raise StepBudgetExceeded()
+        return call(*args)
+
+    setattr(agent, method, countingCall)
+    return calls
+
+
+def counters(layout='large', episodes=200):
+    """
+    Size of a QAgent's table after training with a Counter that stores
+    an entry on every read, against the default SparseCounter table.
+    """
+    argv = ['-q', '-f', '-l', layout, '-n', str(episodes), '-x', str(episodes)]
+    for name in ('Counter', 'SparseCounter'):
+        def prepareAgent(agent):
+            if name == 'Counter':
+                agent.stateActionPair = MaterializingQTable()
+
+        startTime = time.time()
+        agent = runQuietGames(argv, prepareAgent)
+        elapsed = time.time() - startTime
+        print('%-14s %7d entries %9.1f KB of dict %6.2f s' %
+              (name, len(agent.stateActionPair), sys.getsizeof(agent.stateActionPair) / 1024.0, elapsed))
+
+
+def successors(layoutName='large', steps=100000):
+    """
+    Time per GameState.generateSuccessor and per GameState.deepCopy along
+    a random walk on a layout, restarting the walk whenever it wins.
+    """
+    random.seed(0)
+    gameLayout = layout.getLayout(layoutName)
+    start = GameState()
+    start.initialize(gameLayout)
+    states = []
+    actions = []
+    state = start
+    for _ in range(steps):
+        if state.isWin():
+            state = start
+        action = random.choice(state.getLegalActions())
+        states.append(state)
+        actions.append(action)
+        state = state.generateSuccessor(action)
+    GameState.getAndResetExplored()
+
+    startTime = time.time()
+    for state, action in zip(states, actions):
+        state.generateSuccessor(action)
+    successorTime = time.time() - startTime
+    GameState.getAndResetExplored()
+
+    startTime = time.time()
+    for state in states:
+        state.deepCopy()
+    copyTime = time.time() - startTime
+
+    print('generateSuccessor %6.2f us/call' % (1e6 * successorTime / steps))
+    print('deepCopy          %6.2f us/call' % (1e6 * copyTime / steps))
+
+
+def makeOpenGrid(size):
+    """
+    A size x size gridworld: start in one corner, +1 exit in the opposite one.
+    """
+    grid = [[' '] * size for _ in range(size)]
+    grid[0][size - 1] = 1
+    grid[size - 1][0] = 'S'
+    return gridworld.Gridworld(grid)
+
+
+def batched(episodes=2000, batchSize=64):
+    """
+    Transitions per second of Q-learning on BookGrid and a generated 20x20
+    grid: one GridworldEnvironment stepped through runEpisode against a
+    BatchedGridworldEnvironment of batchSize copies.
+    """
+    random.seed(0)
+    for name, world in (('BookGrid', gridworld.getBookGrid()), ('20x20', makeOpenGrid(20))):
+        world.setLivingReward(-0.01)
+        environment = gridworld.GridworldEnvironment(world)
+        agent = qlearningAgents.QLearningAgent(actionFn=world.getPossibleActions, qTable='array',
+                                               stateIndex=world.getStateIndex(),
+                                               actions=('north', 'west', 'south', 'east', 'exit'),
+                                               epsilon=0.3, alpha=0.5, gamma=0.9)
+        counted = countCalls(agent, 'update')
+        quiet = lambda *args: None
+        startTime = time.time()
+        for episode in range(episodes):
+            gridworld.runEpisode(agent, environment, 0.9, agent.getAction, quiet, quiet, quiet, episode)
+        single = len(counted) / max(time.time() - startTime, 1e-9)
+
+        batchAgent = qlearningAgents.BatchedQLearningAgent(
+            gridworld.BatchedGridworldEnvironment(world, batchSize), epsilon=0.3, alpha=0.5, gamma=0.9)
+        startTime = time.time()
+        samples = batchAgent.train(episodes)
+        batch = samples / max(time.time() - startTime, 1e-9)
+        print('%-8s runEpisode %9.0f transitions/s   batched %9.0f transitions/s   (x%.1f)' %
+              (name, single, batch, batch / single))
+
+
+def replay(layout='large', episodes=100, tests=10):
+    """
+    Environment steps, time and test score of a QAgent trained for the same
+    number of episodes with and without experience replay.
+    """
+    argv = ['-q', '-f', '--fastTraining', '-l', layout, '-n', str(episodes + tests), '-x', str(episodes)]
+    for agentArgs in ('abstraction=PositionAbstraction',
+                      'abstraction=PositionAbstraction,replayCapacity=10000,replayRatio=1',
+                      'abstraction=PositionAbstraction,replayCapacity=10000,replayRatio=4'):
+        counters = []
+        startTime = time.time()
+        agent = runQuietGames(argv + ['-o', agentArgs], lambda agent: counters.append(countCalls(agent, 'getAction')))
+        elapsed = time.time() - startTime
+        print('%-66s %6d agent steps %6.2f s  test average %6.1f' %
+              (agentArgs, len(counters[0]), elapsed, agent.accumTestRewards / tests))
+
+
+def greedyScore(agent, gameLayout, maxSteps=1000):
+    """
+    Score of one game played by the agent's greedy policy, or None if it
+    does not reach the goal within maxSteps.
+    """
+    state = GameState()
+    state.initialize(gameLayout)
+    for _ in range(maxSteps):
+        if state.isWin():
+            return state.getScore()
+        state = state.generateSuccessor(agent.computeActionFromQValues(state))
+    return None
+
+
+def episodesToConverge(argv, target, seed=None, maxEpisodes=500, every=1, prepareAgent=None, maxSteps=None):
+    """
+    The number of training episodes of the main.py command argv after which
+    the greedy policy first scores at least target, checked every `every`
+    episodes; None if it does not within maxEpisodes, or within maxSteps
+    training steps (on large, some goals make the agent circle the +100
+    go-to-power jump forever).  prepareAgent, if given, is called with the
+    agent before the first episode.
+    """
+    util.mutePrint()
+    try:
+        args = readArgs(argv + ['-x', str(maxEpisodes), '-n', str(maxEpisodes)], seed, prepareAgent)
+        agent = args['agent']
+        if maxSteps is not None:
+            countCalls(agent, 'getAction', maxSteps)
+        played = 0
+        while played < maxEpisodes:
+            main.runGames(**dict(args, numGames=every, numTraining=every))
+            played += every
+            score = greedyScore(agent, args['layout'])
+            if score is not None and score >= target:
+                return played
+    except StepBudgetExceeded:
+        pass
+    finally:
+        util.unmutePrint()
+    return None
+
+
+def convergeSeeds(argv, target, seeds, prepareAgent=None, maxSteps=None):
+    """
+    episodesToConverge for seeds seeds derived from main.FIXED_SEED.
+    Returns the average over the seeds that converge, the wall-clock
+    seconds per seed and the number of seeds that converge.
+    """
+    startTime = time.time()
+    episodes = [episodesToConverge(argv, target, main.deriveSeed(main.FIXED_SEED, k), prepareAgent=prepareAgent,
+                                   maxSteps=maxSteps)
+                for k in range(seeds)]
+    elapsed = (time.time() - startTime) / seeds
+    converged = [n for n in episodes if n is not None]
+    average = sum(converged) / float(len(converged)) if converged else float('nan')
+    return average, elapsed, len(converged)
+
+
+def convergence(layout='classic', target=580, seeds=10, configs=None, agent='QAgent', maxSteps=None):
+    """
+    Training episodes an agent needs until its greedy policy scores target,
+    averaged over the seeds that get there, for each set of agent args in
+    configs.
+    """
+    if configs is None:
+        configs = ('abstraction=PositionAbstraction',
+                   'abstraction=PositionAbstraction,replayCapacity=10000,replayRatio=4',
+                   'abstraction=PositionAbstraction,replayCapacity=10000,replayRatio=4,replay=prioritized')
+    for agentArgs in configs:
+        argv = ['-q', '--fastTraining', '-l', layout, '-a', agent, '-o', agentArgs]
+        average, elapsed, converged = convergeSeeds(argv, target, seeds, maxSteps=maxSteps)
+        print('%-16s %-88s %6.1f episodes %7.2f s (%d of %d seeds converged)' %
+              (agent, agentArgs, average, elapsed, converged, seeds))
+
+
+def traces(layout='large', target=580, seeds=10, maxSteps=100000):
+    """
+    Episodes until the greedy policy scores target for plain Q-learning
+    against Q(lambda) and SARSA(lambda) with a few values of lambda.
+    """
+    convergence(layout, target, seeds, ('abstraction=PositionAbstraction',), maxSteps=maxSteps)
+    for agent in ('QLambdaAgent', 'SarsaLambdaAgent'):
+        convergence(layout, target, seeds, ['abstraction=PositionAbstraction,traceDecay=%s' % traceDecay
+                                            for traceDecay in ('0.5', '0.9')], agent, maxSteps)
+
+
+def dyna(layout='large', target=580, seeds=5, planningSteps=(0, 5, 20), maxSteps=100000):
+    """
+    Training episodes and wall-clock seconds until the greedy policy scores
+    target, for a DynaQAgent with each number of planningSteps (0 is plain
+    Q-learning), with real steps played through Game.run; and the rates of
+    real steps and planning updates while training.
+    """
+    argv = ['-q', '-l', layout, '-a', 'DynaQAgent']
+    for steps in planningSteps:
+        agentArgs = 'abstraction=PositionAbstraction,planningSteps=%d' % steps
+        agents = []
+        average, elapsed, converged = convergeSeeds(argv + ['-o', agentArgs], target, seeds, agents.append, maxSteps)
+        realSteps = sum(agent.realSteps for agent in agents)
+        realTime = sum(agent.trainingTime - agent.planningTime for agent in agents)
+        planningTime = sum(agent.planningTime for agent in agents)
+        print('planningSteps=%-3d %6.1f episodes %6.2f s (%d of %d seeds converged)   '
+              'real %8.0f steps/s   planning %8.0f updates/s' %
+              (steps, average, elapsed, converged, seeds, realSteps / max(realTime, 1e-9),
+               sum(agent.planningUpdates for agent in agents) / max(planningTime, 1e-9)))
+
+
+BENCHMARKS = {
+    'batched': batched,
+    'convergence': convergence,
+    'dyna': dyna,
+    'replay': replay,
+    'counters': counters,
+    'successors': successors,
+    'traces': traces,
+}
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2 or sys.argv[1] not in BENCHMARKS:
+        print('Usage: python benchmarks.py [%s]' % '|'.join(sorted(BENCHMARKS)))
+        sys.exit(1)
+    BENCHMARKS[sys.argv[1]]()
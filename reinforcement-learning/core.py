@@ -11,7 +11,12 @@ class AgentRules:
         """
         Returns a list of possible actions.
         """
-        return Actions.getPossibleActions(state.getAgentState().configuration, state.data.layout.walls)
+        configuration = state.data.agentState.configuration
+        x, y = configuration.pos
+        if x != int(x) or y != int(y):
+            # In between grid points; only the layout's cells are precomputed
+            return Actions.getPossibleActions(configuration, state.data.layout.walls)
+        return list(state.data.layout.getLegalActions(configuration.pos))
 
     getLegalActions = staticmethod(getLegalActions)
 
@@ -27,27 +32,31 @@ class AgentRules:
 
         # Update Configuration
         vector = Actions.directionToVector(action, AgentRules.AGENT_SPEED)
-        agentState.configuration = agentState.configuration.generateSuccessor(vector)
+        configuration = agentState.configuration.generateSuccessor(vector, action)
+        jump = None
 
         # If Win then give 500 score and make _win to True
-        if state.getAgentPosition() == state.data.layout.selectedGoalPosition:
+        layout = state.data.layout
+        if configuration.pos == layout.selectedGoalPosition:
             state.data._win = True
             state.data.scoreChange += 500
 
         # Update configuration in two special case
-        layout = state.data.layout
         # case 1: Restart
-        if layout.isRestart(agentState.getPosition()):
-            agentState.jump = agentState.configuration
-            agentState.configuration = agentState.configuration.jumpSuccessor(layout.getStart())
+        if layout.isRestart(configuration.pos):
+            jump = configuration
+            configuration = configuration.jumpSuccessor(layout.getStart())
             state.data.scoreChange -= 50
 
         # case 2: power position
-        if layout.isGoToPower(agentState.getPosition()):
-            agentState.jump = agentState.configuration
-            agentState.configuration = agentState.configuration.jumpSuccessor(layout.getPowerPosition())
+        if layout.isGoToPower(configuration.pos):
+            jump = configuration
+            configuration = configuration.jumpSuccessor(layout.getPowerPosition())
             state.data.scoreChange += 100
 
+        # The predecessor may share agentState, so replace it instead of editing it
+        state.data.agentState = agentState.moveTo(configuration, jump)
+
     applyAction = staticmethod(applyAction)
 
 
@@ -113,8 +122,14 @@ class GameState:
     Much of the information in a GameState is stored in a GameStateData object
     """
 
-    # static variable keeps track of which states have had getLegalActions called
+    __slots__ = ('data',)
+
+    # static variables keep track of the agent positions generateSuccessor has
+    # moved between.  Tracking is off by default, so that long training runs do
+    # not grow memory, and holds at most exploredCapacity positions.
     explored = set()
+    trackingExplored = False
+    exploredCapacity = 10000
 
     def getAndResetExplored():
         tmp = GameState.explored.copy()
@@ -123,6 +138,12 @@ class GameState:
 
     getAndResetExplored = staticmethod(getAndResetExplored)
 
+    def trackExplored(enabled=True, capacity=10000):
+        GameState.trackingExplored = enabled
+        GameState.exploredCapacity = capacity
+
+    trackExplored = staticmethod(trackExplored)
+
     def getLegalActions(self):
         if self.isWin():
             return []
@@ -145,8 +166,9 @@ class GameState:
 
         # Book keeping
         state.data.score += state.data.scoreChange
-        GameState.explored.add(self)
-        GameState.explored.add(state)
+        if GameState.trackingExplored and len(GameState.explored) < GameState.exploredCapacity:
+            GameState.explored.add(self.getAgentPosition())
+            GameState.explored.add(state.getAgentPosition())
         return state
 
     def getLegalAgentActions(self):
@@ -164,6 +186,14 @@ class GameState:
     def getScore(self):
         return float(self.data.score)
 
+    def getPositionKey(self):
+        """
+        Returns (agent position, selected goal id): everything about the state
+        that decides how the game continues.  Unlike the state itself it does
+        not depend on the score, so it is a compact key for tabular learners.
+        """
+        return self.data.agentState.getPosition(), self.data.layout.selectedGoalId
+
     def getRestartPosition(self):
         return self.data.layout.restartPositions
 
@@ -198,9 +228,7 @@ class GameState:
             self.data = GameStateData()
 
     def deepCopy(self):
-        state = GameState(self)
-        state.data = self.data.deepCopy()
-        return state
+        return GameState(self)
 
     def __eq__(self, other):
         """
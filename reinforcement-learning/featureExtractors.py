@@ -1,7 +1,46 @@
 from game import Actions
+from layout import GOAL, GO_TO_POWER, RESTART
 import util
 
 
+class StateAbstraction:
+    def getKey(self, state):
+        """
+          Returns the key a tabular agent stores the values
+          of state under.  States with the same key share
+          their Q-values, so keys should only keep what
+          matters for the future of the game.
+        """
+        util.raiseNotDefined()
+
+    def getPosition(self, key):
+        """
+          Returns the agent position a key stands for
+        """
+        util.raiseNotDefined()
+
+
+class IdentityAbstraction(StateAbstraction):
+    def getKey(self, state):
+        return state
+
+    def getPosition(self, key):
+        return key.getAgentPosition()
+
+
+class PositionAbstraction(StateAbstraction):
+    """
+    Keys game states on the agent position and the
+    selected goal only (see GameState.getPositionKey)
+    """
+
+    def getKey(self, state):
+        return state.getPositionKey()
+
+    def getPosition(self, key):
+        return key[0]
+
+
 class FeatureExtractor:
     def getFeatures(self, state, action):
         """
@@ -37,3 +76,29 @@ class SimpleExtractor(FeatureExtractor):
     def getFeatures(self, state, action):
         features = util.Counter()
         return features
+
+
+class CellTypeExtractor(FeatureExtractor):
+    """
+    Indicators for what the cell an action leads to holds,
+    read from the layout's cell type map (see layout.py),
+    plus the scaled distance from there to the selected goal
+    """
+
+    def getFeatures(self, state, action):
+        features = util.Counter()
+        features["bias"] = 1.0
+        layout = state.data.layout
+        x, y = Actions.getSuccessor(state.getAgentPosition(), action)
+        next_x, next_y = int(x), int(y)
+        cellType = layout.getCellType((next_x, next_y))
+        if cellType & GOAL and (next_x, next_y) == layout.selectedGoalPosition:
+            features["goal"] = 1.0
+        if cellType & RESTART:
+            features["restart"] = 1.0
+        if cellType & GO_TO_POWER:
+            features["go-to-power"] = 1.0
+        goal_x, goal_y = layout.selectedGoalPosition
+        distance = abs(next_x - goal_x) + abs(next_y - goal_y)
+        features["goal-distance"] = float(distance) / (layout.width + layout.height)
+        return features
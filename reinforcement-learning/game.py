@@ -37,7 +37,10 @@ class Configuration:
 
     The convention for positions, like a graph, is that (0,0) is the lower left corner, x increases
     horizontally and y increases vertically.  Therefore, up is the direction of increasing y, or (0,1).
+
+    Configurations are never modified once created, so they are freely shared between states.
     """
+    __slots__ = ('pos', 'direction')
 
     def __init__(self, pos, direction):
         self.pos = pos
@@ -66,17 +69,19 @@ class Configuration:
     def __str__(self):
         return "(x,y)=" + str(self.pos) + ", " + str(self.direction)
 
-    def generateSuccessor(self, vector):
+    def generateSuccessor(self, vector, direction=None):
         """
         Generates a new configuration reached by translating the current
         configuration by the action vector.  This is a low-level call and does
         not attempt to respect the legality of the movement.
 
-        Actions are movement vectors.
+        Actions are movement vectors.  Callers that already know the action
+        can pass it as direction instead of having it recovered from the vector.
         """
         x, y = self.pos
         dx, dy = vector
-        direction = Actions.vectorToDirection(vector)
+        if direction is None:
+            direction = Actions.vectorToDirection(vector)
         return Configuration((x + dx, y + dy), direction)
 
     def jumpSuccessor(self, pos):
@@ -86,7 +91,11 @@ class Configuration:
 class AgentState:
     """
     AgentStates hold the state of an agent (configuration, speed, scared, etc).
+
+    Game rules never modify an AgentState in place; a move creates a new one
+    (see moveTo), so states can share the AgentState of their predecessor.
     """
+    __slots__ = ('start', 'configuration', 'jump')
 
     def __init__(self, startConfiguration):
         self.start = startConfiguration
@@ -109,6 +118,16 @@ class AgentState:
         state.configuration = self.configuration
         return state
 
+    def moveTo(self, configuration, jump=None):
+        """
+        Returns a new AgentState at configuration.  jump is the configuration
+        the agent was teleported from during this move, if any.
+        """
+        state = AgentState(self.start)
+        state.configuration = configuration
+        state.jump = jump
+        return state
+
     def getPosition(self):
         if self.configuration is None:
             return None
@@ -120,10 +139,15 @@ class AgentState:
 
 class Grid:
     """
-    A 2-dimensional array of objects backed by a list of lists.  Data is accessed
+    A 2-dimensional array of booleans backed by a bitset.  Data is accessed
     via grid[x][y] where (x,y) are positions on a map with x horizontal,
     y vertical and the origin (0,0) in the bottom left corner.
 
+    Cell (x, y) is bit x * height + y of the bytearray self.bits, so reading
+    or writing a cell touches one byte, while count, hashing, equality and
+    packBits work on the whole bitset at once.  grid[x] is a GridColumn
+    view that reads and writes through to the bits.
+
     The __str__ method constructs an output that is oriented like a board.
     """
 
@@ -134,40 +158,65 @@ class Grid:
 
         self.width = width
         self.height = height
-        self.data = [[initialValue for _ in range(height)] for __ in range(width)]
+        size = width * height
+        self.bits = bytearray(b'\xff' if initialValue else b'\x00') * ((size + 7) // 8)
+        self._clearPadding()
+        self.columns = [GridColumn(self, x) for x in range(width)]
         if bitRepresentation:
             self._unpackBits(bitRepresentation)
 
     def __getitem__(self, i):
-        return self.data[i]
+        return self.columns[i]
+
+    def __iter__(self):
+        return iter(self.columns)
 
     def __setitem__(self, key, item):
-        self.data[key] = item
+        column = self.columns[key]
+        for y, value in enumerate(item):
+            column[y] = value
+
+    def get(self, x, y):
+        cell = x * self.height + y
+        return (self.bits[cell >> 3] >> (cell & 7)) & 1 == 1
+
+    def set(self, x, y, value):
+        cell = x * self.height + y
+        if value:
+            self.bits[cell >> 3] |= 1 << (cell & 7)
+        else:
+            self.bits[cell >> 3] &= ~(1 << (cell & 7)) & 0xff
+
+    def __setstate__(self, state):
+        """
+        Unpickles a grid.  Grids pickled before the bitset, which kept
+        their cells in a list of lists (state['data']), are converted.
+        """
+        if 'data' not in state:
+            self.__dict__.update(state)
+            return
+        self.__init__(state['width'], state['height'])
+        for x, column in enumerate(state['data']):
+            for y, value in enumerate(column):
+                if value:
+                    self.set(x, y, True)
 
     def __str__(self):
-        out = [[str(self.data[x][y])[0] for x in range(self.width)] for y in range(self.height)]
+        out = [[str(self.get(x, y))[0] for x in range(self.width)] for y in range(self.height)]
         out.reverse()
         return '\n'.join([''.join(x) for x in out])
 
     def __eq__(self, other):
         if other is None:
             return False
-        return self.data == other.data
+        return self.width == other.width and self.height == other.height and self.bits == other.bits
 
     def __hash__(self):
-        # return hash(str(self))
-        base = 1
-        h = 0
-        for L in self.data:
-            for i in L:
-                if i:
-                    h += base
-                base *= 2
-        return hash(h)
+        return hash((self.width, self.height, bytes(self.bits)))
 
     def copy(self):
         g = Grid(self.width, self.height)
-        g.data = [x[:] for x in self.data]
+        g.bits = self.bits[:]
         return g
 
     def deepCopy(self):
@@ -175,18 +224,33 @@ class Grid:
 
     def shallowCopy(self):
         g = Grid(self.width, self.height)
-        g.data = self.data
+        g.bits = self.bits
         return g
 
     def count(self, item=True):
-        return sum([x.count(item) for x in self.data])
+        ones = bin(self.asInt()).count('1')
+        return ones if item else self.width * self.height - ones
+
+    def asInt(self):
+        """
+        The whole grid as one int: bit x * height + y is cell (x, y)
+        """
+        return int.from_bytes(self.bits, 'little')
 
     def asList(self, key=True):
         List = []
-        for x in range(self.width):
-            for y in range(self.height):
-                if self[x][y] == key:
-                    List.append((x, y))
+        height = self.height
+        size = self.width * height
+        for index, byte in enumerate(self.bits):
+            if not key:
+                byte ^= 0xff
+            while byte:
+                low = byte & -byte
+                cell = (index << 3) + low.bit_length() - 1
+                if cell >= size:
+                    break
+                List.append(divmod(cell, height))
+                byte ^= low
         return List
 
     def packBits(self):
@@ -194,50 +258,84 @@ class Grid:
         Returns an efficient int list representation
 
         (width, height, bitPackedInts...)
+
+        Each int holds CELLS_PER_INT cells, the first one in its highest bit.
         """
+        size = self.height * self.width
+        chunks = size // self.CELLS_PER_INT + 1
+        # cell 0 first, padded with zeros to a whole number of chunks
+        cells = format(self.asInt(), '0%db' % size)[::-1] if size else ''
+        cells = cells.ljust(chunks * self.CELLS_PER_INT, '0')
         bits = [self.width, self.height]
-        currentInt = 0
-        for i in range(self.height * self.width):
-            bit = self.CELLS_PER_INT - (i % self.CELLS_PER_INT) - 1
-            x, y = self._cellIndexToPosition(i)
-            if self[x][y]:
-                currentInt += 2 ** bit
-            if (i + 1) % self.CELLS_PER_INT == 0:
-                bits.append(currentInt)
-                currentInt = 0
-        bits.append(currentInt)
+        for start in range(0, len(cells), self.CELLS_PER_INT):
+            bits.append(int(cells[start:start + self.CELLS_PER_INT], 2))
         return tuple(bits)
 
     def _cellIndexToPosition(self, index):
-        x = index / self.height
+        x = index // self.height
         y = index % self.height
         return x, y
 
+    def _clearPadding(self):
+        """
+        Keeps the bits past the last cell zero, so that whole-bitset
+        comparisons and counts only see cells
+        """
+        extra = len(self.bits) * 8 - self.width * self.height
+        if extra:
+            self.bits[-1] &= 0xff >> extra
+
     def _unpackBits(self, bits):
         """
         Fills in data from a bit-level representation
         """
-        cell = 0
         for packed in bits:
-            for bit in self._unpackInt(packed, self.CELLS_PER_INT):
-                if cell == self.width * self.height:
-                    break
-                x, y = self._cellIndexToPosition(cell)
-                self[x][y] = bit
-                cell += 1
-
-    def _unpackInt(self, packed, size):
-        bools = []
-        if packed < 0:
-            raise ValueError("must be a positive integer")
-        for i in range(size):
-            n = 2 ** (self.CELLS_PER_INT - i - 1)
-            if packed >= n:
-                bools.append(True)
-                packed -= n
-            else:
-                bools.append(False)
-        return bools
+            if packed < 0:
+                raise ValueError("must be a positive integer")
+        size = self.width * self.height
+        mask = (1 << self.CELLS_PER_INT) - 1
+        cells = ''.join([format(packed & mask, '0%db' % self.CELLS_PER_INT) for packed in bits])
+        cells = cells[:size].ljust(size, '0')
+        value = int(cells[::-1], 2) if size else 0
+        self.bits = bytearray(value.to_bytes(len(self.bits), 'little'))
+
+
+class GridColumn:
+    """
+    Column x of a Grid, so that grid[x][y] reads and writes cell (x, y)
+    """
+    __slots__ = ('grid', 'x')
+
+    def __init__(self, grid, x):
+        self.grid = grid
+        self.x = x
+
+    def __len__(self):
+        return self.grid.height
+
+    def __getitem__(self, y):
+        height = self.grid.height
+        if y < 0:
+            y += height
+        if not 0 <= y < height:
+            raise IndexError('grid column index out of range')
+        cell = self.x * height + y
+        return (self.grid.bits[cell >> 3] >> (cell & 7)) & 1 == 1
+
+    def __setitem__(self, y, value):
+        height = self.grid.height
+        if y < 0:
+            y += height
+        if not 0 <= y < height:
+            raise IndexError('grid column index out of range')
+        self.grid.set(self.x, y, value)
+
+    def __iter__(self):
+        for y in range(self.grid.height):
+            yield self.grid.get(self.x, y)
+
+    def __eq__(self, other):
+        return list(self) == list(other)
 
 
 def reconstituteGrid(bitRep):
@@ -340,16 +438,20 @@ class Actions:
 
 
 class GameStateData:
-    agentState: AgentState = None
+    __slots__ = ('agentState', 'layout', 'score', 'scoreChange', '_win')
 
     def __init__(self, prevState=None):
         """
         Generates a new data packet by copying information from its predecessor.
+
+        The agent state and layout are shared with the predecessor rather than
+        copied: neither is ever modified in place.
         """
         self.scoreChange = 0
         self._win = False
+        self.agentState = None
         if prevState is not None:
-            self.agentState = prevState.agentState.copy()
+            self.agentState = prevState.agentState
             self.layout = prevState.layout
             self.score = prevState.score
 
@@ -357,9 +459,8 @@ class GameStateData:
             self._win = self.agentState.configuration.pos == self.layout.selectedGoalPosition
 
     def deepCopy(self):
-        state = GameStateData(self)
-        state.layout = self.layout.deepCopy()
-        return state
+        # The layout and agent state are immutable and shared
+        return GameStateData(self)
 
     def __eq__(self, other):
         """
@@ -374,36 +475,18 @@ class GameStateData:
         return int((hash(self.agentState) + 13 * hash(self.score)) % 1048575)
 
     def __str__(self):
-        width, height = self.layout.width, self.layout.height
-        map_ = Grid(width, height)
-        walls = self.layout.walls
-        # walls
-        for x in range(width):
-            for y in range(height):
-                map_[x][y] = "%" if walls[x][y] else " "
-
-        # agent
+        # walls, goal, go to power, power and restart cells never change
+        rows = self.layout.getStaticText()
+
+        # agent, unless it stands on one of the special cells
         if self.agentState is not None and self.agentState.configuration is not None:
             x, y = [int(i) for i in nearestPoint(self.agentState.configuration.pos)]
-            map_[x][y] = "A"
-
-        # goal
-        x, y = self.layout.selectedGoalPosition
-        map_[x][y] = "G"
-
-        # go to power position
-        for x, y in self.layout.goToPowerPositions:
-            map_[x][y] = "o"
-
-        # power position
-        x, y = self.layout.powerPosition
-        map_[x][y] = "O"
-
-        # restart
-        for x, y in self.layout.restartPositions:
-            map_[x][y] = "R"
+            row = len(rows) - 1 - y
+            if rows[row][x] == " ":
+                rows = list(rows)
+                rows[row] = rows[row][:x] + "A" + rows[row][x + 1:]
 
-        return str(map_) + ("\nScore: %d\n" % self.score)
+        return "\n".join(rows) + ("\nScore: %d\n" % self.score)
 
     def initialize(self, layout):
         """
@@ -17,7 +17,7 @@ class GraphicsGridworldDisplay:
         wait_for_keys()
 
     def displayValues(self, agent, currentState=None, message='Agent Values'):
-        values = util.Counter()
+        values = util.SparseCounter()
         policy = {}
         states = self.gridworld.getStates()
         for state in states:
@@ -27,7 +27,7 @@ class GraphicsGridworldDisplay:
         sleep(0.05 / self.speed)
 
     def displayNullValues(self, currentState=None, message=''):
-        values = util.Counter()
+        values = util.SparseCounter()
         # policy = {}
         states = self.gridworld.getStates()
         for state in states:
@@ -38,7 +38,7 @@ class GraphicsGridworldDisplay:
         sleep(0.05 / self.speed)
 
     def displayQValues(self, agent, currentState=None, message='Agent Q-Values'):
-        qValues = util.Counter()
+        qValues = util.SparseCounter()
         states = self.gridworld.getStates()
         for state in states:
             for action in self.gridworld.getPossibleActions(state):
@@ -141,7 +141,7 @@ def drawQValues(gridworld, qValues, currentState=None, message='State-Action Q-V
             bestQ = max([qValues[(state, action)] for action in actions])
             bestActions = [action for action in actions if qValues[(state, action)] == bestQ]
 
-            q = util.Counter()
+            q = util.SparseCounter()
             valStrings = {}
             for action in actions:
                 v = qValues[(state, action)]
@@ -1,10 +1,16 @@
 import random
 import sys
+from bisect import bisect_right
 import mdp
 import environment
 import util
 import optparse
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 class Gridworld(mdp.MarkovDecisionProcess):
     """
@@ -20,6 +26,10 @@ class Gridworld(mdp.MarkovDecisionProcess):
         self.livingReward = 0.0
         self.noise = 0.2
 
+        # state numbering and transition table, built on first use
+        self.stateIndex = None
+        self.compiled = None
+
     def setLivingReward(self, reward):
         """
         The (negative) reward for exiting "normal" states.
@@ -29,12 +39,14 @@ class Gridworld(mdp.MarkovDecisionProcess):
         future rewards.
         """
         self.livingReward = reward
+        self.compiled = None
 
     def setNoise(self, noise):
         """
         The probability of moving in an unintended direction.
         """
         self.noise = noise
+        self.compiled = None
 
     def getPossibleActions(self, state):
         """
@@ -64,6 +76,15 @@ class Gridworld(mdp.MarkovDecisionProcess):
                     states.append(state)
         return states
 
+    def getStateIndex(self):
+        """
+        Return the StateIndex of the grid's states, built on first use.
+        The states never change, so neither do their ids.
+        """
+        if self.stateIndex is None:
+            self.stateIndex = mdp.StateIndex(self.getStates())
+        return self.stateIndex
+
     def getReward(self, state, action, nextState):
         """
         Get reward for state, action, nextState transition.
@@ -97,6 +118,16 @@ class Gridworld(mdp.MarkovDecisionProcess):
         """
         return state == self.grid.terminalState
 
+    def compile(self):
+        """
+        Returns the compiled transition table (see mdp.CompiledMDP),
+        building it on first use.  Changing the noise or the living
+        reward discards it.
+        """
+        if self.compiled is None:
+            self.compiled = mdp.CompiledMDP(self, self.__computeTransitionStatesAndProbs)
+        return self.compiled
+
     def getTransitionStatesAndProbs(self, state, action):
         """
         Returns list of (nextState, prob) pairs
@@ -104,7 +135,9 @@ class Gridworld(mdp.MarkovDecisionProcess):
         from 'state' by taking 'action' along
         with their transition probabilities.
         """
+        return self.compile().getTransitionStatesAndProbs(state, action)
 
+    def __computeTransitionStatesAndProbs(self, state, action):
         if action not in self.getPossibleActions(state):
             raise Exception("Illegal action!")
 
@@ -187,7 +220,7 @@ class GridworldEnvironment(environment.Environment):
         else:
             rand = randObj.random()
         sum = 0.0
-        successors = self.gridWorld.getTransitionStatesAndProbs(state, action)
+        successors = self.gridWorld.compile().getTransitionStatesAndProbs(state, action)
         for nextState, prob in successors:
             sum += prob
             if sum > 1.0:
@@ -201,6 +234,141 @@ class GridworldEnvironment(environment.Environment):
         self.state = self.gridWorld.getStartState()
 
 
+class BatchedGridworldEnvironment:
+    """
+      batchSize independent copies of a gridworld, advanced in lockstep.
+
+      States are ids of the compiled MDP (see mdp.CompiledMDP) and an
+      action is an index into compiled.actions[stateId].  step samples
+      the successor of every copy from per (state, action) tables of
+      cumulative probabilities, next state ids and rewards, built once,
+      instead of calling back into the gridworld for each transition.
+      A copy that reaches the terminal state is back at the start state
+      for the next step, and counts as one finished episode.
+
+      With NumPy the tables are also kept as arrays, one row per (state,
+      action) pair padded to the most successors of any pair, and step
+      moves all copies with a few array operations; state ids, actions
+      and rewards are then NumPy arrays.  Without it step loops over the
+      copies.
+    """
+
+    def __init__(self, gridWorld, batchSize, randObj=None):
+        self.gridWorld = gridWorld
+        self.compiled = gridWorld.compile()
+        self.batchSize = batchSize
+        self.random = randObj if randObj is not None else random
+        self.startId = self.compiled.getStateId(gridWorld.getStartState())
+        self.terminal = [not actions for actions in self.compiled.actions]
+
+        stateIds = self.compiled.stateIndex.ids
+        self.cumulative = []
+        self.nextIds = []
+        self.rewards = []
+        for i, state in enumerate(self.compiled.states):
+            cumulativeRows, nextIdRows, rewardRows = [], [], []
+            for action, transitions in zip(self.compiled.actions[i], self.compiled.transitions[i]):
+                total = 0.0
+                cumulative, nextIds, rewards = [], [], []
+                for nextState, prob in transitions:
+                    total += prob
+                    cumulative.append(total)
+                    nextIds.append(stateIds[nextState])
+                    rewards.append(gridWorld.getReward(state, action, nextState))
+                if total > 1.0 + 1e-9:
+                    raise Exception('Total transition probability more than one; sample failure.')
+                # absorb rounding, so that every sample finds a successor
+                cumulative[-1] = 1.0
+                cumulativeRows.append(tuple(cumulative))
+                nextIdRows.append(tuple(nextIds))
+                rewardRows.append(tuple(rewards))
+            self.cumulative.append(tuple(cumulativeRows))
+            self.nextIds.append(tuple(nextIdRows))
+            self.rewards.append(tuple(rewardRows))
+        self.arrays = self.buildArrays() if numpy is not None else None
+        self.generator = numpy.random.default_rng(self.random.getrandbits(64)) if numpy is not None else None
+        self.reset()
+
+    def buildArrays(self):
+        """
+          The tables as NumPy arrays: pairStarts[i] is the row of the first
+          action of state i, and the rows of cumulative, nextIds and
+          rewards hold the successors of each (state, action) pair.  The
+          padding of cumulative is 2.0, above any uniform number.
+        """
+        pairStarts, numPairs, width = [], 0, 1
+        for rows in self.cumulative:
+            pairStarts.append(numPairs)
+            numPairs += len(rows)
+            width = max([width] + [len(row) for row in rows])
+        cumulative = numpy.full((numPairs, width), 2.0)
+        nextIds = numpy.zeros((numPairs, width), dtype=numpy.intp)
+        rewards = numpy.zeros((numPairs, width))
+        for start, cumulativeRows, nextIdRows, rewardRows in zip(pairStarts, self.cumulative, self.nextIds,
+                                                                 self.rewards):
+            for k, (cumulativeRow, nextIdRow, rewardRow) in enumerate(zip(cumulativeRows, nextIdRows, rewardRows)):
+                cumulative[start + k, :len(cumulativeRow)] = cumulativeRow
+                nextIds[start + k, :len(nextIdRow)] = nextIdRow
+                rewards[start + k, :len(rewardRow)] = rewardRow
+        return (numpy.array(pairStarts, dtype=numpy.intp), cumulative, nextIds, rewards,
+                numpy.array(self.terminal, dtype=bool))
+
+    def getStateIds(self):
+        return self.stateIds
+
+    def getPossibleActions(self, stateId):
+        return self.compiled.actions[stateId]
+
+    def step(self, actions, draws=None):
+        """
+          Takes actions[n] in copy n.  Returns (stateIds, nextStateIds,
+          rewards) of the transitions of all copies.  The successor of
+          copy n is the one the uniform number draws[n] falls on; by
+          default the numbers come from the environment's random source.
+        """
+        if self.arrays is not None:
+            return self.stepArrays(actions, draws)
+        if draws is None:
+            rand = self.random.random
+            draws = [rand() for _ in actions]
+        cumulativeTable, nextIdTable, rewardTable = self.cumulative, self.nextIds, self.rewards
+        nextIds = []
+        rewards = []
+        for stateId, action, draw in zip(self.stateIds, actions, draws):
+            k = bisect_right(cumulativeTable[stateId][action], draw)
+            nextIds.append(nextIdTable[stateId][action][k])
+            rewards.append(rewardTable[stateId][action][k])
+
+        stateIds = self.stateIds
+        terminal, startId = self.terminal, self.startId
+        self.stateIds = [startId if terminal[nextId] else nextId for nextId in nextIds]
+        self.episodes += sum([terminal[nextId] for nextId in nextIds])
+        return stateIds, nextIds, rewards
+
+    def stepArrays(self, actions, draws):
+        pairStarts, cumulative, nextIdTable, rewardTable, terminal = self.arrays
+        if draws is None:
+            draws = self.generator.random(self.batchSize)
+        stateIds = self.stateIds
+        pairs = pairStarts[stateIds] + actions
+        # the number of cumulative probabilities <= the draw, as bisect_right
+        k = (cumulative[pairs] <= numpy.asarray(draws)[:, None]).sum(axis=1)
+        nextIds = nextIdTable[pairs, k]
+        rewards = rewardTable[pairs, k]
+
+        finished = terminal[nextIds]
+        self.stateIds = numpy.where(finished, self.startId, nextIds)
+        self.episodes += int(finished.sum())
+        return stateIds, nextIds, rewards
+
+    def reset(self):
+        if self.arrays is not None:
+            self.stateIds = numpy.full(self.batchSize, self.startId, dtype=numpy.intp)
+        else:
+            self.stateIds = [self.startId] * self.batchSize
+        self.episodes = 0
+
+
 class Grid:
     """
     A 2-dimensional array of immutables backed by a list of lists.  Data is accessed
@@ -411,7 +579,8 @@ def parseOptions():
                          help='Request a window width of X pixels *per grid cell* (default %default)')
     optParser.add_option('-a', '--agent', action='store', metavar="A",
                          type='string', dest='agent', default="random",
-                         help='Agent type (options are \'random\', \'value\' and \'q\', default %default)')
+                         help='Agent type (options are \'random\', \'value\', \'prioritized\', \'policy\', ' +
+                              '\'q\' and \'batchedq\', default %default)')
     optParser.add_option('-t', '--text', action='store_true',
                          dest='textDisplay', default=False,
                          help='Use text-only ASCII display')
@@ -429,6 +598,37 @@ def parseOptions():
                          help='Manually control agent')
     optParser.add_option('-v', '--valueSteps', action='store_true', default=False,
                          help='Display each step of value iteration')
+    optParser.add_option('-b', '--backend', action='store', metavar="B",
+                         type='string', dest='backend', default='python',
+                         help='Value iteration backend (options are \'python\' and \'compiled\', which runs on NumPy ' +
+                              'arrays if it is installed, default %default)')
+    optParser.add_option('-c', '--tolerance', action='store',
+                         type='float', dest='tolerance', default=None,
+                         metavar="C", help='Stop value iteration once the Bellman residual is below C ' +
+                                           '(default: always run -i rounds)')
+    optParser.add_option('-u', '--update', action='store', metavar="U",
+                         type='string', dest='update', default='jacobi',
+                         help='Value iteration update (options are \'jacobi\' and \'gauss-seidel\', default %default)')
+    optParser.add_option('-o', '--ordering', action='store', metavar="O",
+                         type='string', dest='ordering', default='default',
+                         help='State order of each value iteration sweep ' +
+                              '(options are \'default\', \'reverse\' and \'exits\', default %default)')
+    optParser.add_option('-j', '--qTable', action='store', metavar="J",
+                         type='string', dest='qTable', default='dict',
+                         help='Q-learning table (options are \'dict\' and \'array\', default %default)')
+    optParser.add_option('-y', '--updates', action='store',
+                         type='int', dest='updates', default=None,
+                         metavar="Y", help='Number of single-state updates of prioritized sweeping ' +
+                                           '(default: as many as -i sweeps over every state)')
+    optParser.add_option('-x', '--evaluationSweeps', action='store',
+                         type='int', dest='evaluationSweeps', default=None,
+                         metavar="X", help='Evaluate each policy with X sweeps (modified policy iteration) ' +
+                                           'instead of an exact linear solve')
+
+    optParser.add_option('-z', '--batchSize', action='store',
+                         type='int', dest='batchSize', default=64,
+                         metavar="Z", help='Number of gridworld copies the batched q agent steps at once ' +
+                                           '(default %default)')
 
     opts, args = optParser.parse_args()
 
@@ -488,7 +688,27 @@ if __name__ == '__main__':
 
     a = None
     if opts.agent == 'value':
-        a = valueIterationAgents.ValueIterationAgent(mdp, opts.discount, opts.iters)
+        a = valueIterationAgents.ValueIterationAgent(mdp, opts.discount, opts.iters, opts.backend, opts.tolerance,
+                                                    opts.update, opts.ordering)
+        print("VALUE ITERATION RAN %d SWEEPS" % a.getSweeps())
+        if opts.update != 'jacobi':
+            jacobi = valueIterationAgents.ValueIterationAgent(mdp, opts.discount, opts.iters, opts.backend,
+                                                              opts.tolerance)
+            print("SYNCHRONOUS (JACOBI) UPDATE RAN %d SWEEPS" % jacobi.getSweeps())
+        if a.residuals:
+            print("FINAL BELLMAN RESIDUAL: %g" % a.residuals[-1])
+            print("POLICY LOSS BOUND: %g" % a.getPolicyLossBound())
+    elif opts.agent == 'prioritized':
+        updates = opts.updates
+        if updates is None:
+            updates = opts.iters * len(mdp.getStates())
+        a = valueIterationAgents.PrioritizedSweepingValueIterationAgent(mdp, opts.discount, updates)
+        print("PRIORITIZED SWEEPING RAN %d STATE UPDATES" % a.updates)
+    elif opts.agent == 'policy':
+        a = valueIterationAgents.PolicyIterationAgent(mdp, opts.discount, opts.iters, opts.evaluationSweeps)
+        print("POLICY ITERATION RAN %d ITERATIONS" % a.policyIterations)
+        print("EVALUATION TIME: %.4f SECONDS" % a.evaluationTime)
+        print("IMPROVEMENT TIME: %.4f SECONDS" % a.improvementTime)
     elif opts.agent == 'q':
         # env.getPossibleActions, opts.discount, opts.learningRate, opts.epsilon
         # simulationFn = lambda agent, state: simulation.GridworldSimulation(agent,state,mdp)
@@ -497,8 +717,22 @@ if __name__ == '__main__':
         qLearnOpts = {'gamma': opts.discount,
                       'alpha': opts.learningRate,
                       'epsilon': opts.epsilon,
-                      'actionFn': actionFn}
+                      'actionFn': actionFn,
+                      'qTable': opts.qTable}
+        if opts.qTable == 'array':
+            qLearnOpts['stateIndex'] = mdp.getStateIndex()
+            qLearnOpts['actions'] = ('north', 'west', 'south', 'east', 'exit')
         a = qlearningAgents.QLearningAgent(**qLearnOpts)
+    elif opts.agent == 'batchedq':
+        import time
+        batchEnv = BatchedGridworldEnvironment(mdp, opts.batchSize)
+        a = qlearningAgents.BatchedQLearningAgent(batchEnv, gamma=opts.discount, alpha=opts.learningRate,
+                                                  epsilon=opts.epsilon)
+        startTime = time.time()
+        samples = a.train(opts.episodes)
+        elapsed = max(time.time() - startTime, 1e-9)
+        print("BATCHED Q-LEARNING RAN %d EPISODES, %d TRANSITIONS IN %.2f SECONDS (%.0f TRANSITIONS/S)" %
+              (batchEnv.episodes, samples, elapsed, samples / elapsed))
     elif opts.agent == 'random':
         # # No reason to use the random agent without episodes
         if opts.episodes == 0:
@@ -534,14 +768,26 @@ if __name__ == '__main__':
     try:
         if not opts.manual and opts.agent == 'value':
             if opts.valueSteps:
-                for i in range(opts.iters):
-                    tempAgent = valueIterationAgents.ValueIterationAgent(mdp, opts.discount, i)
+                print("RESIDUALS: " + " ".join(["%.4g" % r for r in a.residuals]))
+                for i in range(a.getSweeps()):
+                    tempAgent = valueIterationAgents.ValueIterationAgent(mdp, opts.discount, i, opts.backend, None,
+                                                                         opts.update, opts.ordering)
                     display.displayValues(tempAgent, message="VALUES AFTER " + str(i) + " ITERATIONS")
                     display.pause()
 
-            display.displayValues(a, message="VALUES AFTER " + str(opts.iters) + " ITERATIONS")
+            display.displayValues(a, message="VALUES AFTER " + str(a.getSweeps()) + " ITERATIONS")
+            display.pause()
+            display.displayQValues(a, message="Q-VALUES AFTER " + str(a.getSweeps()) + " ITERATIONS")
+            display.pause()
+        if not opts.manual and opts.agent == 'prioritized':
+            display.displayValues(a, message="VALUES AFTER " + str(a.updates) + " STATE UPDATES")
             display.pause()
-            display.displayQValues(a, message="Q-VALUES AFTER " + str(opts.iters) + " ITERATIONS")
+            display.displayQValues(a, message="Q-VALUES AFTER " + str(a.updates) + " STATE UPDATES")
+            display.pause()
+        if not opts.manual and opts.agent == 'policy':
+            display.displayValues(a, message="VALUES AFTER " + str(a.policyIterations) + " POLICY ITERATIONS")
+            display.pause()
+            display.displayQValues(a, message="Q-VALUES AFTER " + str(a.policyIterations) + " POLICY ITERATIONS")
             display.pause()
     except KeyboardInterrupt:
         sys.exit(0)
@@ -554,6 +800,8 @@ if __name__ == '__main__':
         else:
             if opts.agent == 'random': displayCallback = lambda state: display.displayValues(a, state, "CURRENT VALUES")
             if opts.agent == 'value': displayCallback = lambda state: display.displayValues(a, state, "CURRENT VALUES")
+            if opts.agent in ('prioritized', 'policy'):
+                displayCallback = lambda state: display.displayValues(a, state, "CURRENT VALUES")
             if opts.agent == 'q': displayCallback = lambda state: display.displayQValues(a, state, "CURRENT Q-VALUES")
 
     messageCallback = lambda x: printString(x)
@@ -572,6 +820,10 @@ if __name__ == '__main__':
         decisionCallback = a.getAction
 
     # RUN EPISODES
+    # The batched agent has played its episodes already
+    if opts.agent == 'batchedq':
+        opts.episodes = 0
+
     if opts.episodes > 0:
         print()
         print("RUNNING", opts.episodes, "EPISODES")
@@ -587,6 +839,14 @@ if __name__ == '__main__':
         print()
 
     # DISPLAY POST-LEARNING VALUES / Q-VALUES
+    if opts.agent == 'batchedq':
+        try:
+            display.displayQValues(a, message="Q-VALUES AFTER " + str(batchEnv.episodes) + " EPISODES")
+            display.pause()
+            display.displayValues(a, message="VALUES AFTER " + str(batchEnv.episodes) + " EPISODES")
+            display.pause()
+        except KeyboardInterrupt:
+            sys.exit(0)
     if opts.agent == 'q' and not opts.manual:
         try:
             display.displayQValues(a, message="Q-VALUES AFTER " + str(opts.episodes) + " EPISODES")
@@ -1,14 +1,29 @@
 from util import manhattanDistance
-from game import Grid
+from game import Grid, Actions, Configuration, Directions
 import os
 import random
 
 VISIBILITY_MATRIX_CACHE = {}
 
+# Cell types, stored as bit flags in Layout.cellTypes
+WALL = 1
+GOAL = 2
+GO_TO_POWER = 4
+POWER = 8
+RESTART = 16
+
 
 class Layout:
     """
     A Layout manages the static information about the game board.
+
+    A Layout is parsed once and never changes afterwards (its position
+    lists are tuples), so every GameState of every game shares the same
+    object; copying a state never copies its layout.
+
+    The type of every cell is kept as bit flags (WALL, GOAL, ...) in one
+    bytearray, cellTypes[x * height + y], so asking what is at a position
+    costs the same however many special cells the layout has.
     """
 
     def __init__(self, layoutText, copy=False):
@@ -24,6 +39,7 @@ class Layout:
         # Goal
         self.goalPositions = []
         self.selectedGoalPosition = None
+        self.selectedGoalId = None
 
         # Restart position
         self.restartPositions = []
@@ -34,26 +50,63 @@ class Layout:
         # Agent position
         self.agentPosition = None
 
+        # Cell type flags, x-major
+        self.cellTypes = bytearray(self.width * self.height)
+
         self.processLayoutText(layoutText)
+        self.goToPowerPositions = tuple(self.goToPowerPositions)
+        self.goalPositions = tuple(self.goalPositions)
+        self.restartPositions = tuple(self.restartPositions)
+        self.legalActions = self.computeLegalActions()
+        self.staticText = None
         if not copy:
             self.choose_goal()
 
+    def getCellType(self, pos):
+        """
+        The cell type flags at pos, e.g. layout.getCellType(pos) & RESTART
+        """
+        x, y = pos
+        return self.cellTypes[x * self.height + y]
+
     def isWall(self, pos):
-        x, col = pos
-        return self.walls[x][col]
+        x, y = pos
+        return self.cellTypes[x * self.height + y] & WALL != 0
 
     def isRestart(self, pos):
-        return pos in self.restartPositions
+        x, y = pos
+        return self.cellTypes[x * self.height + y] & RESTART != 0
 
     def getStart(self):
         return self.agentPosition
 
     def isGoToPower(self, pos):
-        return pos in self.goToPowerPositions
+        x, y = pos
+        return self.cellTypes[x * self.height + y] & GO_TO_POWER != 0
 
     def getPowerPosition(self):
         return self.powerPosition
 
+    def getLegalActions(self, pos):
+        """
+        Legal actions at the open cell pos, from the table computed at parse time.
+        """
+        x, y = pos
+        return self.legalActions[x][y]
+
+    def computeLegalActions(self):
+        """
+        The walls never move, so the legal actions of every open cell are worked
+        out once: legalActions[x][y] is a tuple of them (None for walls).
+        """
+        table = [[None] * self.height for _ in range(self.width)]
+        for x in range(self.width):
+            for y in range(self.height):
+                if not self.walls[x][y]:
+                    config = Configuration((x, y), Directions.UP)
+                    table[x][y] = tuple(Actions.getPossibleActions(config, self.walls))
+        return table
+
     def getRandomLegalPosition(self):
         x = random.choice(range(self.width))
         y = random.choice(range(self.height))
@@ -74,10 +127,52 @@ class Layout:
     def __str__(self):
         return "\n".join(self.layoutText)
 
+    def getStaticText(self):
+        """
+        Rows (top first) of the board as GameStateData.__str__ draws it
+        without the agent: walls, the selected goal, go to power, power
+        and restart cells.  Built from cellTypes on first use.
+        """
+        if self.staticText is None:
+            rows = []
+            for y in range(self.height - 1, -1, -1):
+                row = []
+                for x in range(self.width):
+                    flags = self.cellTypes[x * self.height + y]
+                    if flags & RESTART:
+                        row.append("R")
+                    elif flags & POWER:
+                        row.append("O")
+                    elif flags & GO_TO_POWER:
+                        row.append("o")
+                    elif (x, y) == self.selectedGoalPosition:
+                        row.append("G")
+                    elif flags & WALL:
+                        row.append("%")
+                    else:
+                        row.append(" ")
+                rows.append("".join(row))
+            self.staticText = rows
+        return self.staticText
+
     def deepCopy(self):
-        layout = Layout(self.layoutText[:], True)
-        layout.selectedGoalPosition = self.selectedGoalPosition
-        return layout
+        """
+        Layouts are immutable, so a copy is the layout itself.
+        """
+        return self
+
+    def __setstate__(self, state):
+        """
+        Unpickles a layout.  Layouts pickled before the cell type and
+        legal action tables existed (e.g. in old recorded game files) are
+        parsed again from their layoutText, keeping their selected goal.
+        """
+        if 'cellTypes' in state and 'legalActions' in state:
+            self.__dict__.update(state)
+            return
+        self.__init__(state['layoutText'], copy=True)
+        if state.get('selectedGoalPosition') in self.goalPositions:
+            self.setGoal(self.goalPositions.index(state['selectedGoalPosition']))
 
     def processLayoutText(self, layoutText):
         """
@@ -100,22 +195,36 @@ class Layout:
                 self.processLayoutChar(x, y, layoutChar)
 
     def processLayoutChar(self, x, y, layoutChar):
+        cell = x * self.height + y
         if layoutChar == '%':
             self.walls[x][y] = True
+            self.cellTypes[cell] |= WALL
         elif layoutChar == 'G':
             self.goalPositions.append((x, y))
+            self.cellTypes[cell] |= GOAL
         elif layoutChar == 'p':
             self.goToPowerPositions.append((x, y))
+            self.cellTypes[cell] |= GO_TO_POWER
         elif layoutChar == 'P':
             self.powerPosition = (x, y)
+            self.cellTypes[cell] |= POWER
         elif layoutChar == "R":
             self.restartPositions.append((x, y))
+            self.cellTypes[cell] |= RESTART
         elif layoutChar == "S":
             self.agentPosition = (x, y)
 
     def choose_goal(self):
         import random
-        self.selectedGoalPosition = random.choice(self.goalPositions)
+        self.setGoal(self.goalPositions.index(random.choice(self.goalPositions)))
+
+    def setGoal(self, goalId):
+        """
+        Selects goalPositions[goalId] as the goal of the game
+        """
+        self.selectedGoalPosition = self.goalPositions[goalId]
+        self.selectedGoalId = goalId
+        self.staticText = None
 
 
 def getLayout(name, back=2):
@@ -2,6 +2,16 @@ import time
 
 import util
 from game import Agent
+from replayMemory import ReplayMemory, PrioritizedReplayMemory
+
+
+def getLegalActions(state):
+    """
+      The default actionFn of a ReinforcementAgent.  A module-level
+      function rather than a lambda, so that agents can be pickled
+      (main.runGames sends them to worker processes).
+    """
+    return state.getLegalActions()
 
 
 class ValueEstimationAgent(Agent):
@@ -83,10 +93,13 @@ class ReinforcementAgent(ValueEstimationAgent):
         - Use self.getLegalActions(state) to know which actions are available in a state
     """
 
-    def update(self, state, action, nextState, reward):
+    def update(self, state, action, nextState, reward, weight=1.0):
         """
                 This class will call this function, which you write, after
-                observing a transition and reward
+                observing a transition and reward.  Replayed transitions
+                come with the importance-sampling weight of their sample,
+                to scale the step by; return the TD error, so that a
+                prioritized replay memory can reprioritize the transition
         """
         util.raiseNotDefined()
 
@@ -106,6 +119,32 @@ class ReinforcementAgent(ValueEstimationAgent):
         """
         self.episodeRewards += deltaReward
         self.update(state, action, nextState, deltaReward)
+        if self.replayMemory is not None and self.isInTraining():
+            self.replayMemory.push(state, action, deltaReward, nextState)
+            self.replay()
+
+    def replay(self):
+        """
+          Replays replayRatio stored transitions per observed transition
+          through self.update, in minibatches of replayBatchSize drawn
+          from the replay memory
+        """
+        self.replayCredit += self.replayRatio
+        memory = self.replayMemory
+        while self.replayCredit >= self.replayBatchSize:
+            self.replayCredit -= self.replayBatchSize
+            slots = memory.sample(self.replayBatchSize)
+            for slot, weight in zip(slots, memory.getWeights(slots, self.getImportanceExponent())):
+                state, action, reward, nextState = memory.getTransition(slot)
+                memory.updatePriority(slot, self.update(state, action, nextState, reward, weight))
+
+    def getImportanceExponent(self):
+        """
+          The exponent of the importance-sampling weights, annealed from
+          importanceExponent at the start of training to 1 at its end
+        """
+        progress = min(1.0, self.episodesSoFar / float(max(1, self.numTraining)))
+        return self.importanceExponent + (1.0 - self.importanceExponent) * progress
 
     def startEpisode(self):
         """
@@ -135,7 +174,8 @@ class ReinforcementAgent(ValueEstimationAgent):
     def isInTesting(self):
         return not self.isInTraining()
 
-    def __init__(self, actionFn=None, numTraining=100, epsilon=0.5, alpha=0.5, gamma=1):
+    def __init__(self, actionFn=None, numTraining=100, epsilon=0.5, alpha=0.5, gamma=1, replayCapacity=0,
+                 replayRatio=1, replayBatchSize=32, replay='uniform', priorityExponent=0.6, importanceExponent=0.4):
         """
         actionFn: Function which takes a state and returns the list of legal actions
 
@@ -143,10 +183,17 @@ class ReinforcementAgent(ValueEstimationAgent):
         epsilon  - exploration rate
         gamma    - discount factor
         numTraining - number of training episodes, i.e. no learning after these many episodes
+
+        replayCapacity  - transitions kept for experience replay (0: no replay)
+        replayRatio     - stored transitions replayed per observed transition
+        replayBatchSize - transitions per replayed minibatch
+        replay          - 'uniform' sampling, or 'prioritized' by |TD error|
+        priorityExponent   - how strongly prioritized replay follows the TD errors
+        importanceExponent - importance-sampling correction at the start of training
         """
         super(ReinforcementAgent, self).__init__(alpha, epsilon, gamma, numTraining)
         if actionFn is None:
-            actionFn = lambda state: state.getLegalActions()
+            actionFn = getLegalActions
         self.actionFn = actionFn
         self.episodesSoFar = 0
         self.accumTrainRewards = 0.0
@@ -155,6 +202,18 @@ class ReinforcementAgent(ValueEstimationAgent):
         self.epsilon = float(epsilon)
         self.alpha = float(alpha)
         self.discount = float(gamma)
+        self.replayMemory = None
+        if int(replayCapacity) > 0:
+            if replay == 'uniform':
+                self.replayMemory = ReplayMemory(int(replayCapacity))
+            elif replay == 'prioritized':
+                self.replayMemory = PrioritizedReplayMemory(int(replayCapacity), exponent=float(priorityExponent))
+            else:
+                raise Exception('Unknown replay type: ' + str(replay))
+        self.importanceExponent = float(importanceExponent)
+        self.replayRatio = float(replayRatio)
+        self.replayBatchSize = max(1, int(replayBatchSize))
+        self.replayCredit = 0.0
 
     def setEpsilon(self, epsilon):
         self.epsilon = epsilon
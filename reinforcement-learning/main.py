@@ -1,10 +1,15 @@
 import os
 import random
 import sys
+import time
 
 import layout
-from core import ClassicGameRules
-from game import Directions
+import recording
+from core import ClassicGameRules, GameState
+from game import Directions, Game
+
+# Seed of --fixRandomSeed
+FIXED_SEED = 'hiren-chalodiya'
 
 
 def default(string):
@@ -25,9 +30,24 @@ def parseAgentArgs(string):
     return opts
 
 
-def readCommand(argv):
+def deriveSeed(seed, index):
+    """
+    The seed of the index-th game or run played under seed, or None
+    (fresh randomness) if there is no seed to derive it from.
+    """
+    if seed is None:
+        return None
+    return '%s-%d' % (seed, index)
+
+
+def readCommand(argv, seed=None, seeds=None):
     """
     Processes the command used to run from the command line.
+
+    seed, if given, replaces the seed of --fixRandomSeed and seeds
+    overrides --seeds; runSeeds uses both to replay a command.  The
+    number of seeds is returned as args['seeds']: the other args are
+    those of runGames, which plays one seed.
     """
     from optparse import OptionParser
     usageStr = """
@@ -54,9 +74,16 @@ def readCommand(argv):
     parser.add_option('-f', '--fixRandomSeed', action='store_true', dest='fixRandomSeed',
                       help='Fixes the random seed to always play the same game', default=False)
     parser.add_option('-r', '--recordActions', action='store_true', dest='record',
-                      help='Writes game histories to a file (named by the time they were played)', default=False)
+                      help='Writes game histories to a recording file (named by the time they were played)',
+                      default=False)
+    parser.add_option('--recordTraining', action='store_true', dest='recordTraining',
+                      help='With -r, records the training episodes too', default=False)
     parser.add_option('--replay', dest='gameToReplay',
-                      help='A recorded game file (pickle) to replay', default=None)
+                      help='A recording file, or a recorded game file (pickle), to replay', default=None)
+    parser.add_option('--replayEpisode', dest='replayEpisode', type='int',
+                      help=default('The episode of a recording file to replay'), default=0)
+    parser.add_option('--replayStep', dest='replayStep', type='int',
+                      help=default('The step of the episode to start the replay at'), default=0)
     parser.add_option('-o', '--agentArgs', dest='agentArgs',
                       help='Comma separated values sent to agent. e.g. "opt1=val1,opt2,opt3=val3"')
     parser.add_option('-x', '--numTraining', dest='numTraining', type='int',
@@ -69,6 +96,14 @@ def readCommand(argv):
                       help=default('Maximum length of time an agent can spend computing in a single game'), default=30)
     parser.add_option('-p', '--pathPrint', dest='pathPrint', action='store_true',
                       help="Print path cost and followed path", default=False)
+    parser.add_option('--fastTraining', dest='fastTraining', action='store_true',
+                      help='Play the training episodes in a tight loop without display, muting or timeouts',
+                      default=False)
+    parser.add_option('-w', '--workers', dest='workers', type='int',
+                      help=default('Number of processes that play the games after training'), default=1)
+    parser.add_option('--seeds', dest='seeds', type='int',
+                      help=default('Number of independent runs (training included) to play, one per seed, '
+                                   'spread over the workers'), default=1)
 
     options, otherjunk = parser.parse_args(argv)
     if len(otherjunk) != 0:
@@ -76,8 +111,16 @@ def readCommand(argv):
     args = dict()
 
     # Fix the random seed
-    if options.fixRandomSeed:
-        random.seed('hiren-chalodiya')
+    if seed is None and options.fixRandomSeed:
+        seed = FIXED_SEED
+    if seed is not None:
+        random.seed(seed)
+    if seeds is None:
+        seeds = options.seeds
+
+    if seeds > 1 and options.record:
+        raise Exception('--seeds cannot be combined with -r: every run chooses its own goal, '
+                        'and a recording holds the games of one goal')
 
     # Choose a layout
     args['layout'] = layout.getLayout(options.layout)
@@ -113,13 +156,26 @@ def readCommand(argv):
         args['display'] = graphicsDisplay.GameGraphics(options.zoom, frameTime=options.frameTime)
     args['numGames'] = options.numGames
     args['record'] = options.record
+    args['recordTraining'] = options.recordTraining
     args['catchExceptions'] = options.catchExceptions
     args['timeout'] = options.timeout
     args['pathPrint'] = options.pathPrint
+    args['fastTraining'] = options.fastTraining
+    args['workers'] = options.workers
+    args['seed'] = seed
+    args['seeds'] = seeds
 
     # Special case: recorded games don't use the runGames method or args structure
     if options.gameToReplay is not None:
         print('Replaying recorded game %s.' % options.gameToReplay)
+        f = open(options.gameToReplay, 'rb')
+        try:
+            isRecording = f.read(len(recording.MAGIC)) == recording.MAGIC
+        finally:
+            f.close()
+        if isRecording:
+            replayRecording(options.gameToReplay, options.replayEpisode, options.replayStep, args['display'])
+            sys.exit(0)
         import pickle
         f = open(options.gameToReplay, 'rb')
         try:
@@ -170,7 +226,224 @@ def replayGame(layout, actions, display):
     display.finish()
 
 
-def runGames(layout, agent, display, numGames, record, pathPrint, numTraining=0, catchExceptions=False, timeout=30):
+def replayRecording(path, episode, step, display):
+    """
+    Replays episode of a recording file from step on; the state at step
+    is read from the recording, not replayed from the start.
+    """
+    import recordAgent
+    gameRecording = recording.Recording(path)
+    try:
+        actions = gameRecording.getActions(episode, step)
+        state = gameRecording.getState(episode, step)
+    finally:
+        gameRecording.close()
+    rules = ClassicGameRules()
+    game = rules.newGame(gameRecording.layout, recordAgent.RecordAgent(actions), display)
+    game.state = state
+    display.initialize(state.data)
+
+    for action in actions:
+        state = state.generateSuccessor(action)
+        display.update(state.data)
+        rules.process(state, game)
+
+    display.finish()
+
+
+def printKnowledgeBase(agent):
+    positionDict: dict = dict()  # [UP, DOWN LEFT, RIGHT]
+    for key, value in agent.stateActionPair.items():
+        state, action = key
+        value = f"{value:.2f}"
+        pos = agent.stateAbstraction.getPosition(state)
+        if pos not in positionDict:
+            positionDict[pos] = [None, None, None, None]
+        if action == Directions.UP:
+            positionDict[pos][0] = value
+        if action == Directions.DOWN:
+            positionDict[pos][1] = value
+        if action == Directions.LEFT:
+            positionDict[pos][2] = value
+        if action == Directions.RIGHT:
+            positionDict[pos][3] = value
+
+    print("Knowledge base: (Position: UP, DOWN, LEFT, RIGHT)")
+    for key, value in positionDict.items():
+        print(f"\t{key}: {value}")
+
+
+def runFastTraining(layout, agent, numTraining, recorder=None):
+    """
+    Plays numTraining episodes with the same agent callbacks, in the same
+    order, as Game.run, but without a display, muting, timeouts or
+    defensive state copies.  States are never modified once generated, so
+    the agent can be handed them directly.  Episodes are streamed to
+    recorder (a recording.Recorder), if given.
+    """
+    registerInitialState = getattr(agent, 'registerInitialState', None)
+    observationFunction = getattr(agent, 'observationFunction', None)
+    final = getattr(agent, 'final', None)
+
+    steps = 0
+    startTime = time.time()
+    for _ in range(numTraining):
+        state = GameState()
+        state.initialize(layout)
+        if registerInitialState is not None:
+            registerInitialState(state)
+        if recorder is not None:
+            recorder.startEpisode(state)
+        while not state.isWin():
+            observation = observationFunction(state) if observationFunction is not None else state
+            action = agent.getAction(observation)
+            state = state.generateSuccessor(action)
+            if recorder is not None:
+                recorder.recordStep(action, state)
+            steps += 1
+        if recorder is not None:
+            recorder.endEpisode()
+        if final is not None:
+            final(state)
+    elapsed = max(time.time() - startTime, 1e-9)
+    print('Fast training: %d episodes, %d steps in %.2f seconds (%.1f episodes/s, %.1f steps/s)' %
+          (numTraining, steps, elapsed, numTraining / elapsed, steps / elapsed))
+
+
+# The layout and agent of runParallelGames, set in each worker by startWorker
+workerGame = None
+
+
+def startWorker(layout, agent):
+    """
+    Initializer of the runParallelGames pool.  Forked workers inherit the
+    agent instead of receiving a pickled copy with every batch of games.
+    """
+    global workerGame
+    workerGame = (layout, agent)
+
+
+def playGames(job):
+    """
+    Worker of runParallelGames: plays the games numbered indices with its
+    own copy of the agent, seeding random for each game from its number,
+    and returns the final state and move history of each.
+    """
+    indices, seed, timeout, catchExceptions = job
+    import textDisplay
+    import util
+    layout, agent = workerGame
+    rules = ClassicGameRules(timeout)
+    results = []
+    util.mutePrint()
+    try:
+        for i in indices:
+            random.seed(deriveSeed(seed, i))
+            game = rules.newGame(layout, agent, textDisplay.NullGraphics(), True, catchExceptions)
+            game.run()
+            results.append((game.state, game.moveHistory))
+    finally:
+        util.unmutePrint()
+    return results
+
+
+def runParallelGames(layout, agent, display, rules, indices, workers, seed, catchExceptions=False):
+    """
+    Plays the games numbered indices in a pool of worker processes and
+    returns them in order.  Each game is seeded from its number (see
+    deriveSeed), so the results do not depend on the number of workers.
+    The workers play with copies of the agent: what it learns in one game
+    is not seen by the others, so this is meant for games after training.
+    """
+    import multiprocessing
+    shards = [indices[k::workers] for k in range(workers)]
+    shards = [shard for shard in shards if shard]
+    jobs = [(shard, seed, rules.timeout, catchExceptions) for shard in shards]
+    pool = multiprocessing.Pool(len(jobs), startWorker, (layout, agent))
+    try:
+        results = pool.map(playGames, jobs, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+    played = {}
+    for shard, shardResults in zip(shards, results):
+        for i, result in zip(shard, shardResults):
+            played[i] = result
+
+    games = []
+    for i in indices:
+        state, moveHistory = played[i]
+        game = Game(agent, display, rules)
+        game.state = state
+        game.moveHistory = moveHistory
+        game.gameOver = True
+        games.append(game)
+    return games
+
+
+def runSeed(job):
+    """
+    Worker of runSeeds: plays the command argv with the given seed and
+    returns the score and move history of each game after training.
+    """
+    argv, seed = job
+    import textDisplay
+    import util
+    random.seed(seed)
+    util.mutePrint()
+    try:
+        args = readCommand(argv, seed, seeds=1)
+        del args['seeds']
+        args['display'] = textDisplay.NullGraphics()
+        args['workers'] = 1
+        args['pathPrint'] = False
+        games = runGames(**args)
+    finally:
+        util.unmutePrint()
+    return [(game.state.getScore(), game.moveHistory) for game in games]
+
+
+def runSeeds(argv, seeds, workers, seed=None, pathPrint=False):
+    """
+    Plays the command argv seeds times, training included, each time
+    with its own seed derived from seed, in a pool of worker processes.
+    Returns the (score, move history) of the games of each run; with
+    pathPrint, the paths are printed too.
+    """
+    import multiprocessing
+    jobs = [(argv, deriveSeed(seed, k)) for k in range(seeds)]
+    pool = multiprocessing.Pool(max(1, min(workers, seeds)))
+    try:
+        results = pool.map(runSeed, jobs)
+    finally:
+        pool.close()
+        pool.join()
+
+    allScores = []
+    for k, games in enumerate(results):
+        scores = [score for score, _ in games]
+        allScores.extend(scores)
+        if pathPrint:
+            for _, moveHistory in games:
+                print("\tPath followed: ", " ".join(moveHistory))
+        if scores:
+            print('Seed %d: Average Score: %.1f' % (k, sum(scores) / float(len(scores))))
+    if allScores:
+        print('Average Score:', sum(allScores) / float(len(allScores)))
+    return results
+
+
+def getRecorder(layout):
+    """
+    A recorder to a new recording file, named by the time it was created
+    """
+    fname = 'recorded-games-' + '-'.join([str(t) for t in time.localtime()[1:6]]) + '.rec'
+    return recording.Recorder(fname, layout)
+
+
+def runGames(layout, agent, display, numGames, record, pathPrint, numTraining=0, catchExceptions=False, timeout=30,
+             fastTraining=False, workers=1, seed=None, recordTraining=False):
     import __main__
     __main__.__dict__['_display'] = display
 
@@ -179,8 +452,26 @@ def runGames(layout, agent, display, numGames, record, pathPrint, numTraining=0,
 
     printKnowledge = pathPrint
 
-    for i in range(numGames):
+    recorder = getRecorder(layout) if record else None
+
+    firstGame = 0
+    if fastTraining and numTraining > 0:
+        firstGame = min(numTraining, numGames)
+        runFastTraining(layout, agent, firstGame, recorder if recordTraining else None)
+        if printKnowledge and 'stateActionPair' in dir(agent):
+            printKnowledgeBase(agent)
+            printKnowledge = False
+
+    # With several workers only the training games are played here
+    lastGame = numGames
+    if workers > 1:
+        lastGame = max(firstGame, min(numTraining, numGames))
+
+    for i in range(firstGame, lastGame):
         beQuiet = i < numTraining
+        if not beQuiet and seed is not None:
+            # Seeded like the games of runParallelGames, so scores do not depend on the workers
+            random.seed(deriveSeed(seed, i))
         if beQuiet:
             # Suppress output and graphics
             import textDisplay
@@ -194,25 +485,7 @@ def runGames(layout, agent, display, numGames, record, pathPrint, numTraining=0,
 
         if printKnowledge and i == numTraining - 1:
             if 'stateActionPair' in dir(agent):
-                positionDict: dict = dict()  # [UP, DOWN LEFT, RIGHT]
-                for key, value in game.agent.stateActionPair.items():
-                    state, action = key
-                    value = f"{value:.2f}"
-                    pos = state.data.agentState.configuration.pos
-                    if pos not in positionDict:
-                        positionDict[pos] = [None, None, None, None]
-                    if action == Directions.UP:
-                        positionDict[pos][0] = value
-                    if action == Directions.DOWN:
-                        positionDict[pos][1] = value
-                    if action == Directions.LEFT:
-                        positionDict[pos][2] = value
-                    if action == Directions.RIGHT:
-                        positionDict[pos][3] = value
-
-                print("Knowledge base: (Position: UP, DOWN, LEFT, RIGHT)")
-                for key, value in positionDict.items():
-                    print(f"\t{key}: {value}")
+                printKnowledgeBase(game.agent)
                 printKnowledge = False
 
         if not beQuiet:
@@ -220,14 +493,24 @@ def runGames(layout, agent, display, numGames, record, pathPrint, numTraining=0,
             if pathPrint:
                 print("\tPath followed: ", " ".join(game.moveHistory))
 
-        if record and not beQuiet:
-            import time
-            import pickle
-            fname = ('recorded-game-%d' % (i + 1)) + '-'.join([str(t) for t in time.localtime()[1:6]])
-            f = open(fname, 'wb')
-            components = {'layout': layout, 'actions': game.moveHistory}
-            pickle.dump(components, f)
-            f.close()
+        if record and (recordTraining or not beQuiet):
+            recorder.recordEpisode(game.moveHistory)
+
+    if lastGame < numGames:
+        indices = list(range(lastGame, numGames))
+        rules.quiet = False
+        for i, game in zip(indices, runParallelGames(layout, agent, display, rules, indices, workers, seed,
+                                                     catchExceptions)):
+            if game.state.isWin():
+                print("Agent Reached !! Score: %d" % game.state.getScore())
+            games.append(game)
+            if pathPrint:
+                print("\tPath followed: ", " ".join(game.moveHistory))
+            if record:
+                recorder.recordEpisode(game.moveHistory)
+
+    if recorder is not None:
+        recorder.close()
 
     if (numGames - numTraining) > 0:
         scores = [game.state.getScore() for game in games]
@@ -239,4 +522,8 @@ def runGames(layout, agent, display, numGames, record, pathPrint, numTraining=0,
 
 if __name__ == '__main__':
     args = readCommand(sys.argv[1:])  # Get game components based on input
-    runGames(**args)
+    seeds = args.pop('seeds')
+    if seeds > 1:
+        runSeeds(sys.argv[1:], seeds, args['workers'], args['seed'], args['pathPrint'])
+    else:
+        runGames(**args)
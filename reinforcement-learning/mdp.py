@@ -1,5 +1,10 @@
 from abc import ABC, abstractmethod
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 class MarkovDecisionProcess(ABC):
 
@@ -52,3 +57,162 @@ class MarkovDecisionProcess(ABC):
         state as having a self-loop action 'pass' with zero reward; the formulations
         are equivalent.
         """
+
+    def getStateIndex(self):
+        """
+        Return a StateIndex numbering the states of the MDP.
+        Not generally possible for large MDPs.
+        """
+        return StateIndex(self.getStates())
+
+    def compile(self):
+        """
+        Returns a CompiledMDP snapshot of this (finite) MDP.
+        """
+        return CompiledMDP(self)
+
+
+class StateIndex:
+    """
+    Interns states to contiguous integer ids 0, 1, 2, ... and back, so
+    values and Q-values can be kept in flat lists indexed by id instead
+    of dicts keyed by (possibly large) state objects.
+
+    Ids are handed out in order of first appearance and never change.
+    An index can be built from a known list of states, or grown on the
+    fly with intern() when the states are only discovered by acting.
+    """
+
+    def __init__(self, states=()):
+        self.states = []
+        self.ids = {}
+        for state in states:
+            self.intern(state)
+
+    def __len__(self):
+        return len(self.states)
+
+    def __contains__(self, state):
+        return state in self.ids
+
+    def intern(self, state):
+        """
+        Returns the id of state, giving it the next free id if it is new.
+        """
+        stateId = self.ids.get(state)
+        if stateId is None:
+            stateId = len(self.states)
+            self.ids[state] = stateId
+            self.states.append(state)
+        return stateId
+
+    def getId(self, state):
+        return self.ids[state]
+
+    def getState(self, stateId):
+        return self.states[stateId]
+
+
+class CompiledMDP:
+    """
+    A snapshot of a finite MarkovDecisionProcess with states interned
+    to dense integer ids, so planners can run their Bellman backups over
+    plain lists instead of calling back into the mdp for every state,
+    action and sweep.
+
+    For state id i and the k-th legal action of that state:
+
+      actions[i][k]    - the action itself
+      rewards[i][k]    - expected reward, sum_s' T(s,a,s') R(s,a,s')
+      successors[i][k] - sparse row of T as a tuple of (nextStateId, prob)
+      transitions[i][k] - the same row as a tuple of (nextState, prob)
+
+    States with no legal actions (terminal states) have empty tuples.
+    getArrays gives the same table as NumPy arrays, when it is installed.
+
+    transitionFunction defaults to mdp.getTransitionStatesAndProbs; an
+    mdp that answers that method from its own compiled table passes the
+    underlying computation instead.
+    """
+
+    def __init__(self, mdp, transitionFunction=None):
+        if transitionFunction is None:
+            transitionFunction = mdp.getTransitionStatesAndProbs
+        self.stateIndex = mdp.getStateIndex()
+        self.states = self.stateIndex.states
+        stateIds = self.stateIndex.ids
+        self.actions = []
+        self.rewards = []
+        self.successors = []
+        self.transitions = []
+        for state in self.states:
+            actions = tuple(mdp.getPossibleActions(state))
+            rewards = []
+            successors = []
+            transitions = []
+            for action in actions:
+                reward = 0.0
+                row = []
+                statesAndProbs = tuple(transitionFunction(state, action))
+                for nextState, prob in statesAndProbs:
+                    reward += prob * mdp.getReward(state, action, nextState)
+                    row.append((stateIds[nextState], prob))
+                rewards.append(reward)
+                successors.append(tuple(row))
+                transitions.append(statesAndProbs)
+            self.actions.append(actions)
+            self.rewards.append(tuple(rewards))
+            self.successors.append(tuple(successors))
+            self.transitions.append(tuple(transitions))
+        self.arrays = None
+
+    def __len__(self):
+        return len(self.states)
+
+    def getArrays(self):
+        """
+        The transition table as NumPy arrays, built on first use (None if
+        NumPy is not installed).  Every (state, action) pair is one row,
+        rows of the same state being contiguous:
+
+          pairStates  - state id of each row
+          pairRewards - expected reward of each row
+          successorRows, nextIds, probs - the successors of all rows: the
+                        row, next state id and probability of each
+          stateStarts - first row of each state that has actions
+          activeIds   - the ids of the states that have actions
+        """
+        if numpy is None:
+            return None
+        if self.arrays is None:
+            pairStates, pairRewards, successorRows, nextIds, probs, stateStarts, activeIds = [], [], [], [], [], [], []
+            for i, (rewards, successors) in enumerate(zip(self.rewards, self.successors)):
+                if not rewards:
+                    continue
+                activeIds.append(i)
+                stateStarts.append(len(pairStates))
+                for reward, row in zip(rewards, successors):
+                    for j, prob in row:
+                        successorRows.append(len(pairStates))
+                        nextIds.append(j)
+                        probs.append(prob)
+                    pairStates.append(i)
+                    pairRewards.append(reward)
+            self.arrays = (numpy.array(pairStates, dtype=numpy.intp), numpy.array(pairRewards, dtype=float),
+                           numpy.array(successorRows, dtype=numpy.intp), numpy.array(nextIds, dtype=numpy.intp),
+                           numpy.array(probs, dtype=float), numpy.array(stateStarts, dtype=numpy.intp),
+                           numpy.array(activeIds, dtype=numpy.intp))
+        return self.arrays
+
+    def getStateId(self, state):
+        return self.stateIndex.getId(state)
+
+    def getState(self, stateId):
+        return self.stateIndex.getState(stateId)
+
+    def getTransitionStatesAndProbs(self, state, action):
+        i = self.stateIndex.getId(state)
+        actions = self.actions[i]
+        if action not in actions:
+            raise Exception("Illegal action!")
+        return self.transitions[i][actions.index(action)]
@@ -0,0 +1,163 @@
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import util
+from mdp import StateIndex
+
+
+class DictQTable(util.SparseCounter):
+    """
+      Q-values in a SparseCounter keyed by (state, action).  This is the
+      original storage of QLearningAgent and works for any hashable
+      states and actions; reading a pair never stores it.
+    """
+
+    def getQValue(self, state, action):
+        return self[(state, action)]
+
+    def setQValue(self, state, action, value):
+        self[(state, action)] = value
+
+
+def newMatrix(rows, width):
+    """
+      A zeroed rows x width matrix of doubles and its flat, row-major view
+    """
+    if numpy is not None:
+        values = numpy.zeros((rows, width))
+        return values, values.reshape(-1)
+    values = array('d', bytes(8 * rows * width))
+    return values, values
+
+
+class ArrayQTable:
+    """
+      Q-values in a (states x actions) matrix: a NumPy 2-D array when
+      NumPy is installed, else one flat array of doubles laid out
+      row-major.  Either way flat holds the values in row-major order,
+      and a cell is an index into it.  States and actions are interned
+      to dense ids (see mdp.StateIndex) the first time they are written;
+      reading an unseen pair returns 0.0 without storing it.
+
+      Passing the stateIndex of an MDP (mdp.getStateIndex()) and its
+      actions up front fixes the layout.  The table interns into a copy
+      of that index, never into the MDP's own, which its compiled table
+      shares.  Rows are added as new states show up, and the matrix is
+      widened if a new action does.
+    """
+
+    def __init__(self, stateIndex=None, actions=()):
+        self.stateIndex = StateIndex(stateIndex.states if stateIndex is not None else ())
+        self.actionIndex = StateIndex(actions)
+        self.rows = max(1, len(self.stateIndex))
+        self.width = max(1, len(self.actionIndex))
+        self.values, self.flat = newMatrix(self.rows, self.width)
+        self.written = bytearray(self.rows * self.width)
+
+    def __len__(self):
+        return sum(self.written)
+
+    def getQValue(self, state, action):
+        stateId = self.stateIndex.ids.get(state)
+        actionId = self.actionIndex.ids.get(action)
+        if stateId is None or actionId is None:
+            return 0.0
+        return float(self.flat[stateId * self.width + actionId])
+
+    def setQValue(self, state, action, value):
+        cell = self.getCell(state, action)
+        self.flat[cell] = value
+
+    def getCell(self, state, action):
+        """
+          Returns the flat index of (state, action), interning either
+          one and growing the matrix as needed.
+        """
+        actionId = self.actionIndex.intern(action)
+        if actionId >= self.width:
+            self.resize(self.rows, 2 * self.width)
+        stateId = self.stateIndex.intern(state)
+        if stateId >= self.rows:
+            self.resize(2 * self.rows, self.width)
+        cell = stateId * self.width + actionId
+        self.written[cell] = 1
+        return cell
+
+    def findCell(self, state, action):
+        """
+          Returns the flat index of (state, action), or None if either
+          one has not been interned; unlike getCell it stores nothing.
+        """
+        stateId = self.stateIndex.ids.get(state)
+        actionId = self.actionIndex.ids.get(action)
+        if stateId is None or actionId is None:
+            return None
+        return stateId * self.width + actionId
+
+    def getCellValues(self, cells):
+        flat = self.flat
+        return [flat[cell] for cell in cells]
+
+    def backupCells(self, cells, nextCells, rewards, alpha, discount):
+        """
+          Q-learning backups of a batch of transitions by flat index, all
+          against the values from before the batch: the target of
+          transition n is rewards[n] + discount * the max of the values
+          at nextCells[n] (0 if there are none), and each cell moves alpha
+          of the way to the mean target of its transitions.
+
+          With NumPy the batch is arrays, nextCells being 2-D with one row
+          per transition padded with -1, and the backup is one array
+          update.  Without it nextCells is a list of sequences of cells.
+          The cells must be within the matrix, e.g. found with findCell
+          on a fixed layout.
+        """
+        flat, written = self.flat, self.written
+        if not isinstance(flat, array):
+            nextValues = numpy.where(nextCells >= 0, flat[nextCells], -numpy.inf)
+            qNext = nextValues.max(axis=1, initial=-numpy.inf)
+            qNext[qNext == -numpy.inf] = 0.0
+            errors = rewards + discount * qNext - flat[cells]
+            updated, batchIds = numpy.unique(cells, return_inverse=True)
+            counts = numpy.bincount(batchIds)
+            flat[updated] += alpha * numpy.bincount(batchIds, errors) / counts
+            numpy.frombuffer(written, dtype=numpy.uint8)[updated] = 1
+            return
+        errors = {}
+        counts = {}
+        for cell, nextRow, reward in zip(cells, nextCells, rewards):
+            qNext = max([flat[c] for c in nextRow]) if nextRow else 0.0
+            error = reward + discount * qNext - flat[cell]
+            errors[cell] = errors.get(cell, 0.0) + error
+            counts[cell] = counts.get(cell, 0) + 1
+        for cell, error in errors.items():
+            flat[cell] += alpha * error / counts[cell]
+            written[cell] = 1
+
+    def resize(self, rows, width):
+        """
+          Reallocates the matrix as rows x width, keeping every value and
+          written flag at its (state id, action id).
+        """
+        values, flat = newMatrix(rows, width)
+        written = bytearray(rows * width)
+        for row in range(self.rows):
+            start, oldStart = row * width, row * self.width
+            flat[start:start + self.width] = self.flat[oldStart:oldStart + self.width]
+            written[start:start + self.width] = self.written[oldStart:oldStart + self.width]
+        self.values, self.flat, self.written = values, flat, written
+        self.rows, self.width = rows, width
+
+    def items(self):
+        """
+          ((state, action), value) for every pair that has been written,
+          like the items of a DictQTable.
+        """
+        for cell, written in enumerate(self.written):
+            if written:
+                row, column = divmod(cell, self.width)
+                yield (self.stateIndex.getState(row), self.actionIndex.getState(column)), float(self.flat[cell])
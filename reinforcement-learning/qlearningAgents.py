@@ -1,8 +1,15 @@
 from learningAgents import ReinforcementAgent
 from featureExtractors import *
+from qTables import DictQTable, ArrayQTable
 import random
+import time
 import util
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 class QLearningAgent(ReinforcementAgent):
     """
@@ -25,11 +32,27 @@ class QLearningAgent(ReinforcementAgent):
           which returns legal actions for a state
     """
 
-    def __init__(self, **args):
-        """Initialize Q-values here..."""
+    def __init__(self, qTable='dict', stateIndex=None, actions=(), abstraction='IdentityAbstraction', **args):
+        """
+        Initialize Q-values here...
+
+        qTable selects where the Q-values are kept (see qTables.py):
+            'dict'  - a SparseCounter keyed by (state, action)
+            'array' - a flat array indexed by interned state and action ids;
+                      stateIndex and actions optionally fix its layout up front
+
+        abstraction names the StateAbstraction (see featureExtractors.py)
+        whose keys the table is indexed by, e.g. PositionAbstraction
+        """
         ReinforcementAgent.__init__(self, **args)
+        self.stateAbstraction = util.lookup(abstraction, globals())()
 
-        self.stateActionPair = util.Counter()  # {(state, action): value}}
+        if qTable == 'dict':
+            self.stateActionPair = DictQTable()  # {(state, action): value}}
+        elif qTable == 'array':
+            self.stateActionPair = ArrayQTable(stateIndex, actions)
+        else:
+            raise Exception('Unknown Q-table type: ' + str(qTable))
 
     def getQValue(self, state, action):
         """
@@ -37,7 +60,7 @@ class QLearningAgent(ReinforcementAgent):
           Should return 0.0 if we have never seen a state
           or the Q node value otherwise
         """
-        return self.stateActionPair[(state, action)]
+        return self.stateActionPair.getQValue(self.stateAbstraction.getKey(state), action)
 
     def computeValueFromQValues(self, state):
         """
@@ -81,18 +104,25 @@ class QLearningAgent(ReinforcementAgent):
         else:
             return self.computeActionFromQValues(state)
 
-    def update(self, state, action, nextState, reward):
+    def update(self, state, action, nextState, reward, weight=1.0):
         """
           The parent class calls this to observe a
           state = action => nextState and reward transition.
           You should do your Q-Value update here
 
+          weight scales the learning rate (importance-sampling
+          correction of replayed transitions); returns the TD error
+
           NOTE: You should never call this function,
           it will be called on your behalf
         """
         qThis = self.getQValue(state, action)
         qNext = self.getValue(nextState)
-        self.stateActionPair[(state, action)] = (1 - self.alpha) * qThis + self.alpha * (reward + self.discount * qNext)
+        target = reward + self.discount * qNext
+        alpha = self.alpha * weight
+        self.stateActionPair.setQValue(self.stateAbstraction.getKey(state), action,
+                                       (1 - alpha) * qThis + alpha * target)
+        return target - qThis
 
     def getPolicy(self, state):
         return self.computeActionFromQValues(state)
@@ -101,6 +131,111 @@ class QLearningAgent(ReinforcementAgent):
         return self.computeValueFromQValues(state)
 
 
+class BatchedQLearningAgent(QLearningAgent):
+    """
+      Q-learning on a BatchedGridworldEnvironment (see gridworld.py).
+      getActions picks the epsilon-greedy actions of every copy and
+      updateBatch applies all of their TD updates in one call each.  Both
+      work on compiled state ids and read and write the flat array of an
+      ArrayQTable laid out by the compiled MDP, so the values and policy
+      can be read like those of an ordinary QLearningAgent.
+
+      The updates of a batch are synchronous, as in ArrayQTable.backupCells:
+      every target is computed from the values before the batch.  With
+      NumPy (when the environment steps with arrays) both methods are a
+      few array operations over the whole batch; without it they loop
+      over the copies.
+    """
+
+    def __init__(self, environment, **args):
+        compiled = environment.compiled
+        actions = []
+        for stateActions in compiled.actions:
+            actions.extend([action for action in stateActions if action not in actions])
+        args['qTable'] = 'array'
+        args['stateIndex'] = compiled.stateIndex
+        args['actions'] = actions
+        if 'actionFn' not in args:
+            args['actionFn'] = environment.gridWorld.getPossibleActions
+        QLearningAgent.__init__(self, **args)
+        self.environment = environment
+
+        # cells[i][k]: index in the table of the k-th action of state i
+        table = self.stateActionPair
+        self.cells = [tuple([table.findCell(state, action) for action in stateActions])
+                      for state, stateActions in zip(compiled.states, compiled.actions)]
+
+        # the same as a matrix padded with -1, and the number of actions of each state
+        self.cellMatrix = self.actionCounts = self.generator = None
+        if environment.arrays is not None:
+            width = max([1] + [len(cells) for cells in self.cells])
+            self.cellMatrix = numpy.full((len(self.cells), width), -1, dtype=numpy.intp)
+            for i, cells in enumerate(self.cells):
+                self.cellMatrix[i, :len(cells)] = cells
+            self.actionCounts = numpy.array([len(cells) for cells in self.cells], dtype=numpy.intp)
+            self.generator = numpy.random.default_rng(random.getrandbits(64))
+
+    def getActions(self, stateIds):
+        if self.cellMatrix is not None:
+            return self.getActionArray(stateIds)
+        getCellValues = self.stateActionPair.getCellValues
+        cellTable = self.cells
+        epsilon = self.epsilon
+        actions = []
+        for stateId in stateIds:
+            cells = cellTable[stateId]
+            if len(cells) == 1:
+                actions.append(0)
+            elif random.random() < epsilon:
+                actions.append(random.randrange(len(cells)))
+            else:
+                qValues = getCellValues(cells)
+                maxQ = max(qValues)
+                best = [k for k, qValue in enumerate(qValues) if qValue == maxQ]
+                actions.append(best[0] if len(best) == 1 else random.choice(best))
+        return actions
+
+    def getActionArray(self, stateIds):
+        generator = self.generator
+        cells = self.cellMatrix[stateIds]
+        qValues = numpy.where(cells >= 0, self.stateActionPair.flat[cells], -numpy.inf)
+        # break ties uniformly: the best action with the largest random key
+        best = qValues == qValues.max(axis=1, keepdims=True)
+        greedy = (best * generator.random(cells.shape)).argmax(axis=1)
+        explore = generator.random(len(cells)) < self.epsilon
+        randomActions = (generator.random(len(cells)) * self.actionCounts[stateIds]).astype(numpy.intp)
+        return numpy.where(explore, randomActions, greedy)
+
+    def updateBatch(self, stateIds, actions, nextStateIds, rewards):
+        """
+          The Q-learning updates of a batch of transitions between
+          compiled state ids
+        """
+        if self.cellMatrix is not None:
+            self.stateActionPair.backupCells(self.cellMatrix[stateIds, actions], self.cellMatrix[nextStateIds],
+                                             rewards, self.alpha, self.discount)
+            return
+        cellTable = self.cells
+        self.stateActionPair.backupCells([cellTable[stateId][action] for stateId, action in zip(stateIds, actions)],
+                                         [cellTable[nextStateId] for nextStateId in nextStateIds],
+                                         rewards, self.alpha, self.discount)
+
+    def train(self, episodes):
+        """
+          Steps all copies of the environment until episodes episodes
+          have finished between them.  Returns the number of transitions.
+        """
+        environment = self.environment
+        environment.reset()
+        samples = 0
+        while environment.episodes < episodes:
+            actions = self.getActions(environment.getStateIds())
+            stateIds, nextStateIds, rewards = environment.step(actions)
+            self.updateBatch(stateIds, actions, nextStateIds, rewards)
+            samples += len(actions)
+        return samples
+
+
 class QAgent(QLearningAgent):
     """Exactly the same as QLearningAgent, but with different default parameters"""
 
@@ -132,6 +267,185 @@ class QAgent(QLearningAgent):
         return action
 
 
+class DynaQAgent(QAgent):
+    """
+      Dyna-Q: a QAgent that also learns a model of the game from the
+      transitions it observes, (state key, action) -> (state, nextState,
+      reward) as last seen, and after every real step in training does
+      planningSteps Q-updates on transitions drawn uniformly from the
+      model.  Real steps are played through the game; planning steps are
+      a table lookup and an update, so they are far cheaper.
+
+      The model keeps the last outcome of each pair, which is exact for
+      the deterministic layouts of this game.
+    """
+
+    def __init__(self, planningSteps=10, **args):
+        QAgent.__init__(self, **args)
+        self.planningSteps = int(planningSteps)
+        self.model = {}  # {(key, action): index in modelPairs}
+        self.modelPairs = []  # (state, action, nextState, reward)
+
+        self.realSteps = 0
+        self.planningUpdates = 0
+        self.planningTime = 0.0
+        self.trainingStartTime = None
+        self.trainingTime = 0.0
+
+    def observeTransition(self, state, action, nextState, deltaReward):
+        QAgent.observeTransition(self, state, action, nextState, deltaReward)
+        if not self.isInTraining():
+            return
+        self.realSteps += 1
+        pair = (self.stateAbstraction.getKey(state), action)
+        index = self.model.get(pair)
+        if index is None:
+            self.model[pair] = len(self.modelPairs)
+            self.modelPairs.append((state, action, nextState, deltaReward))
+        else:
+            self.modelPairs[index] = (state, action, nextState, deltaReward)
+        self.plan()
+
+    def plan(self):
+        """
+          planningSteps Q-updates on transitions drawn from the model
+        """
+        startTime = time.time()
+        pairs = self.modelPairs
+        size = len(pairs)
+        for _ in range(self.planningSteps):
+            state, action, nextState, reward = pairs[int(random.random() * size)]
+            self.update(state, action, nextState, reward)
+        self.planningUpdates += self.planningSteps
+        self.planningTime += time.time() - startTime
+
+    def registerInitialState(self, state):
+        QAgent.registerInitialState(self, state)
+        if self.isInTraining():
+            self.trainingStartTime = time.time()
+
+    def stopEpisode(self):
+        if self.trainingStartTime is not None:
+            self.trainingTime += time.time() - self.trainingStartTime
+            self.trainingStartTime = None
+        QAgent.stopEpisode(self)
+
+    def getStepRates(self):
+        """
+          (real steps per second, planning updates per second) of training
+          so far.  Real steps are timed by the rest of the training time,
+          so they include the game, action selection and the Q-update.
+        """
+        realTime = self.trainingTime - self.planningTime
+        return (self.realSteps / max(realTime, 1e-9), self.planningUpdates / max(self.planningTime, 1e-9))
+
+    def final(self, state):
+        QAgent.final(self, state)
+        if self.episodesSoFar == self.numTraining and self.numTraining > 0:
+            realRate, planningRate = self.getStepRates()
+            print('Dyna-Q: %d real steps (%.1f steps/s), %d planning updates (%.1f updates/s)' %
+                  (self.realSteps, realRate, self.planningUpdates, planningRate))
+
+
+class QLambdaAgent(QAgent):
+    """
+      Watkins's Q(lambda): every TD error also updates the state-action
+      pairs visited earlier in the episode, in proportion to their
+      eligibility trace, so a reward reaches back along the path in one
+      step rather than one state per visit.  Traces are replacing (a
+      visited pair's trace is set to 1) and decay by gamma * lambda per
+      step; they are cut after an exploratory action, after which the
+      earlier pairs no longer lead the greedy way.
+
+      Traces are kept sparsely, {(state key, action): trace} for the
+      active pairs only, and dropped once they decay below
+      traceThreshold, so a step costs O(active traces), about
+      log(traceThreshold) / log(gamma * lambda), whatever the size of
+      the table.  Traces are reset at the start of each episode.
+    """
+
+    def __init__(self, traceDecay=0.9, traceThreshold=0.01, **args):
+        """
+        traceDecay     - lambda, how far back along the path TD errors reach
+        traceThreshold - traces below this are dropped
+        """
+        QAgent.__init__(self, **args)
+        if self.replayMemory is not None:
+            raise Exception('Eligibility traces cannot be combined with experience replay')
+        self.traceDecay = float(traceDecay)
+        self.traceThreshold = float(traceThreshold)
+        self.traces = {}
+
+    def startEpisode(self):
+        QAgent.startEpisode(self)
+        self.traces = {}
+
+    def update(self, state, action, nextState, reward, weight=1.0):
+        delta = reward + self.discount * self.getValue(nextState) - self.getQValue(state, action)
+        self.applyTraces(state, action, delta * weight)
+        return delta
+
+    def applyTraces(self, state, action, delta):
+        """
+          Sets the trace of (state, action) to 1, moves every pair with
+          an active trace by alpha * delta * trace, then decays the traces
+          and drops those below traceThreshold
+        """
+        table = self.stateActionPair
+        traces = self.traces
+        traces[(self.stateAbstraction.getKey(state), action)] = 1.0
+        step = self.alpha * delta
+        decay = self.discount * self.traceDecay
+        threshold = self.traceThreshold
+        for pair, trace in list(traces.items()):
+            key, pairAction = pair
+            table.setQValue(key, pairAction, table.getQValue(key, pairAction) + step * trace)
+            trace *= decay
+            if trace < threshold:
+                del traces[pair]
+            else:
+                traces[pair] = trace
+
+    def getAction(self, state):
+        action = QLearningAgent.getAction(self, state)
+        if self.traces and action is not None and self.getQValue(state, action) < self.getValue(state):
+            self.traces.clear()
+        self.doAction(state, action)
+        return action
+
+
+class SarsaLambdaAgent(QLambdaAgent):
+    """
+      SARSA(lambda): on-policy TD(lambda) control with the sparse traces
+      of QLambdaAgent.  The TD error of a transition needs the action
+      taken next, so its update waits for getAction in the next state
+      (or is applied at once if the next state is terminal).  Traces are
+      never cut, exploratory actions included.
+    """
+
+    def startEpisode(self):
+        QLambdaAgent.startEpisode(self)
+        self.pending = None
+
+    def update(self, state, action, nextState, reward, weight=1.0):
+        if self.getLegalActions(nextState):
+            self.pending = (state, action, reward, weight)
+            return None
+        delta = reward - self.getQValue(state, action)
+        self.applyTraces(state, action, delta * weight)
+        return delta
+
+    def getAction(self, state):
+        action = QLearningAgent.getAction(self, state)
+        if self.pending is not None:
+            lastState, lastAction, reward, weight = self.pending
+            self.pending = None
+            delta = reward + self.discount * self.getQValue(state, action) - self.getQValue(lastState, lastAction)
+            self.applyTraces(lastState, lastAction, delta * weight)
+        self.doAction(state, action)
+        return action
+
+
 class ApproximateQAgent(QAgent):
     """
        ApproximateQLearningAgent
@@ -144,7 +458,7 @@ class ApproximateQAgent(QAgent):
     def __init__(self, extractor='IdentityExtractor', **args):
         self.featExtractor = util.lookup(extractor, globals())()
         QAgent.__init__(self, **args)
-        self.weights = util.Counter()
+        self.weights = util.SparseCounter()
 
     def getWeights(self):
         return self.weights
@@ -160,14 +474,18 @@ class ApproximateQAgent(QAgent):
             qValue += self.weights[feature] * features[feature]
         return qValue
 
-    def update(self, state, action, nextState, reward):
+    def update(self, state, action, nextState, reward, weight=1.0):
         qNext = self.getValue(nextState)
         difference = (reward + self.discount * qNext) - self.getQValue(state, action)
         features = self.featExtractor.getFeatures(state, action)
         for feature in features:
-            self.weights[feature] += self.alpha * difference * features[feature]
+            self.weights[feature] += self.alpha * weight * difference * features[feature]
+        return difference
 
 
 # abbreviation
 QA = QAgent
 AQ = ApproximateQAgent
+DQ = DynaQAgent
+QL = QLambdaAgent
+SL = SarsaLambdaAgent
@@ -0,0 +1,271 @@
+"""
+Streamed recordings of many games on one layout.
+
+A recording file starts with a header holding the layout text and the
+selected goal, written once.  Episodes are appended one step at a time:
+each step is its action code and the score change it caused.  Every
+checkpointInterval steps a checkpoint of the state (agent position,
+direction and score) comes first, so the records of an episode are
+fixed-size blocks of one checkpoint and checkpointInterval steps.  The
+byte offset of any step is then a formula, and the state before it is
+rebuilt from at most checkpointInterval - 1 moves after its checkpoint.
+
+Closing a Recorder appends an index of the episodes.  A file that was
+not closed (e.g. a crashed run) is still readable: Recording then scans
+it once to build the index.
+
+    recorder = Recorder('games.rec', layout)
+    recorder.recordEpisode(game.moveHistory)
+    recorder.close()
+
+    recording = Recording('games.rec')
+    state = recording.getState(episode=3, step=120)
+"""
+import json
+import os
+import struct
+
+import layout as layouts
+from core import GameState
+from game import Configuration, Directions
+
+MAGIC = b'RLREC1\n'
+CHECKPOINT_INTERVAL = 64
+
+ACTIONS = (Directions.UP, Directions.DOWN, Directions.LEFT, Directions.RIGHT)
+ACTION_CODES = dict((action, code) for code, action in enumerate(ACTIONS))
+
+# Record tags; a step starts with its action code instead
+EPISODE = 0xFD
+CHECKPOINT = 0xFE
+END = 0xFF
+
+LENGTH = struct.Struct('<I')
+STEP = struct.Struct('<Bh')  # action code, score change
+CHECKPOINT_RECORD = struct.Struct('<BhhBi')  # tag, x, y, direction code, score
+END_RECORD = struct.Struct('<BIi')  # tag, steps, final score
+INDEX_ENTRY = struct.Struct('<QI')  # episode offset, steps
+TRAILER = struct.Struct('<Q4s')  # index offset, tag
+INDEX_TAG = b'RIDX'
+
+
+def blockSize(checkpointInterval):
+    return CHECKPOINT_RECORD.size + checkpointInterval * STEP.size
+
+
+class Recorder:
+    """
+    Appends episodes played on one layout to a recording file.  An
+    existing recording of the same layout and goal is extended.
+    """
+
+    def __init__(self, path, layout, checkpointInterval=CHECKPOINT_INTERVAL):
+        self.path = path
+        self.layout = layout
+        self.episodes = []  # (offset, steps)
+        self.steps = None
+
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            existing = Recording(path)
+            if existing.layout.layoutText != layout.layoutText or existing.goalId != layout.selectedGoalId:
+                raise Exception('The recording ' + path + ' is of another layout')
+            self.checkpointInterval = existing.checkpointInterval
+            self.episodes = list(existing.episodes)
+            end = existing.dataEnd
+            existing.close()
+            self.file = open(path, 'r+b')
+            self.file.truncate(end)
+            self.file.seek(end)
+        else:
+            self.checkpointInterval = checkpointInterval
+            self.file = open(path, 'wb')
+            header = json.dumps({'layout': layout.layoutText, 'goal': layout.selectedGoalId,
+                                 'checkpointInterval': checkpointInterval}).encode('utf-8')
+            self.file.write(MAGIC + LENGTH.pack(len(header)) + header)
+
+    def startEpisode(self, state):
+        if self.steps is not None:
+            raise Exception('The previous episode was not ended')
+        self.episodes.append((self.file.tell(), 0))
+        self.file.write(bytes([EPISODE]))
+        self.steps = 0
+        self.lastState = state
+
+    def recordStep(self, action, state):
+        """
+        Records action, which led from the previous state to state
+        """
+        if self.steps % self.checkpointInterval == 0:
+            previous = self.lastState
+            x, y = previous.getAgentPosition()
+            direction = ACTION_CODES.get(previous.data.agentState.getDirection(), 0)
+            self.file.write(CHECKPOINT_RECORD.pack(CHECKPOINT, int(x), int(y), direction, previous.data.score))
+        delta = state.data.score - self.lastState.data.score
+        self.file.write(STEP.pack(ACTION_CODES[action], delta))
+        self.steps += 1
+        self.lastState = state
+
+    def endEpisode(self):
+        self.file.write(END_RECORD.pack(END, self.steps, self.lastState.data.score))
+        offset, _ = self.episodes[-1]
+        self.episodes[-1] = (offset, self.steps)
+        self.steps = None
+        self.lastState = None
+
+    def recordEpisode(self, actions):
+        """
+        Records a whole episode from its actions, replaying them from the
+        start of the layout to get the score changes
+        """
+        state = GameState()
+        state.initialize(self.layout)
+        self.startEpisode(state)
+        for action in actions:
+            nextState = state.generateSuccessor(action)
+            self.recordStep(action, nextState)
+            state = nextState
+        self.endEpisode()
+
+    def close(self):
+        """
+        Appends the episode index and closes the file
+        """
+        if self.steps is not None:
+            self.endEpisode()
+        indexOffset = self.file.tell()
+        self.file.write(LENGTH.pack(len(self.episodes)))
+        for offset, steps in self.episodes:
+            self.file.write(INDEX_ENTRY.pack(offset, steps))
+        self.file.write(TRAILER.pack(indexOffset, INDEX_TAG))
+        self.file.close()
+
+
+class Recording:
+    """
+    Reads a recording file.  Any state of any episode is found without
+    reading the episodes or steps before it.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        if self.file.read(len(MAGIC)) != MAGIC:
+            raise Exception(path + ' is not a recording')
+        length, = LENGTH.unpack(self.file.read(LENGTH.size))
+        header = json.loads(self.file.read(length).decode('utf-8'))
+        self.dataStart = self.file.tell()
+        self.checkpointInterval = header['checkpointInterval']
+        self.goalId = header['goal']
+        self.layout = layouts.Layout(header['layout'], copy=True)
+        self.layout.setGoal(self.goalId)
+        self.episodes = self.readIndex()
+        if self.episodes is None:
+            self.episodes = self.scanEpisodes()
+
+    def close(self):
+        self.file.close()
+
+    def readIndex(self):
+        self.file.seek(0, os.SEEK_END)
+        size = self.file.tell()
+        if size - self.dataStart < TRAILER.size:
+            return None
+        self.file.seek(size - TRAILER.size)
+        indexOffset, tag = TRAILER.unpack(self.file.read(TRAILER.size))
+        if tag != INDEX_TAG or not self.dataStart <= indexOffset < size:
+            return None
+        self.file.seek(indexOffset)
+        count, = LENGTH.unpack(self.file.read(LENGTH.size))
+        data = self.file.read(count * INDEX_ENTRY.size)
+        self.dataEnd = indexOffset
+        return [INDEX_ENTRY.unpack_from(data, i * INDEX_ENTRY.size) for i in range(count)]
+
+    def scanEpisodes(self):
+        """
+        Builds the episode index of a file that has none, stopping at the
+        first incomplete record
+        """
+        episodes = []
+        interval = self.checkpointInterval
+        offset = self.dataStart
+        self.file.seek(offset)
+        data = self.file.read()
+        position = 0
+        self.dataEnd = offset
+        while position < len(data) and data[position] == EPISODE:
+            start = position
+            position += 1
+            steps = 0
+            while True:
+                if position >= len(data):
+                    return episodes
+                if data[position] == END:
+                    if position + END_RECORD.size > len(data):
+                        return episodes
+                    position += END_RECORD.size
+                    break
+                position += CHECKPOINT_RECORD.size if steps % interval == 0 else 0
+                position += STEP.size
+                if position > len(data):
+                    return episodes
+                steps += 1
+            episodes.append((offset + start, steps))
+            self.dataEnd = offset + position
+        return episodes
+
+    def __len__(self):
+        return len(self.episodes)
+
+    def getNumSteps(self, episode):
+        return self.episodes[episode][1]
+
+    def stepOffset(self, episode, step):
+        """
+        The file offset of the step record of step in episode
+        """
+        offset, _ = self.episodes[episode]
+        block, i = divmod(step, self.checkpointInterval)
+        return offset + 1 + block * blockSize(self.checkpointInterval) + CHECKPOINT_RECORD.size + i * STEP.size
+
+    def readSteps(self, episode, start, stop):
+        """
+        (action, score change) of the steps start..stop-1 of episode
+        """
+        steps = []
+        step = start
+        while step < stop:
+            # the steps of one block are contiguous
+            blockEnd = min(stop, (step // self.checkpointInterval + 1) * self.checkpointInterval)
+            self.file.seek(self.stepOffset(episode, step))
+            data = self.file.read((blockEnd - step) * STEP.size)
+            for i in range(blockEnd - step):
+                code, delta = STEP.unpack_from(data, i * STEP.size)
+                steps.append((ACTIONS[code], delta))
+            step = blockEnd
+        return steps
+
+    def getActions(self, episode, start=0, stop=None):
+        if stop is None:
+            stop = self.getNumSteps(episode)
+        return [action for action, _ in self.readSteps(episode, start, stop)]
+
+    def getState(self, episode, step=0):
+        """
+        The GameState before step of episode (after its last step if step
+        is the number of steps)
+        """
+        steps = self.getNumSteps(episode)
+        if not 0 <= step <= steps:
+            raise IndexError('step %d of an episode of %d steps' % (step, steps))
+        block = min(step, steps - 1) // self.checkpointInterval if steps else 0
+        state = GameState()
+        state.initialize(self.layout)
+        if steps:
+            self.file.seek(self.stepOffset(episode, block * self.checkpointInterval) - CHECKPOINT_RECORD.size)
+            _, x, y, direction, score = CHECKPOINT_RECORD.unpack(self.file.read(CHECKPOINT_RECORD.size))
+            agentState = state.data.agentState
+            state.data.agentState = agentState.moveTo(Configuration((x, y), ACTIONS[direction]))
+            state.data.score = score
+            state.data._win = (x, y) == self.layout.selectedGoalPosition
+        for action, _ in self.readSteps(episode, block * self.checkpointInterval, step):
+            state = state.generateSuccessor(action)
+        return state
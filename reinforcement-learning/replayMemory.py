@@ -0,0 +1,188 @@
+from array import array
+import random
+
+from mdp import StateIndex
+
+
+class ReplayMemory:
+    """
+      A fixed-capacity ring buffer of transitions for experience replay.
+
+      Transitions are kept in preallocated arrays of state ids, action
+      ids, rewards and next state ids; once the buffer is full, each new
+      transition overwrites the oldest.  States are interned to ids that
+      are reference counted and reused once no stored transition holds
+      them, so at most 2 * capacity states are ever kept.  Consecutive
+      transitions of an episode share a state and so share its id.
+    """
+
+    def __init__(self, capacity, actions=()):
+        self.capacity = capacity
+        self.actionIndex = StateIndex(actions)
+        self.stateIds = array('l', bytes(array('l').itemsize * capacity))
+        self.actionIds = array('l', bytes(array('l').itemsize * capacity))
+        self.rewards = array('d', bytes(8 * capacity))
+        self.nextStateIds = array('l', bytes(array('l').itemsize * capacity))
+        self.size = 0
+        self.position = 0
+
+        # state interning: ids[state], states[id], references to each id
+        self.ids = {}
+        self.states = [None] * (2 * capacity)
+        self.references = array('l', bytes(array('l').itemsize * 2 * capacity))
+        self.freeIds = list(range(2 * capacity - 1, -1, -1))
+
+    def __len__(self):
+        return self.size
+
+    def push(self, state, action, reward, nextState):
+        """
+          Stores a transition, evicting the oldest one if the memory is
+          full.  Returns the slot it was stored in.
+        """
+        slot = self.position
+        if self.size == self.capacity:
+            self.release(self.stateIds[slot])
+            self.release(self.nextStateIds[slot])
+        else:
+            self.size += 1
+        self.stateIds[slot] = self.acquire(state)
+        self.actionIds[slot] = self.actionIndex.intern(action)
+        self.rewards[slot] = reward
+        self.nextStateIds[slot] = self.acquire(nextState)
+        self.position = (slot + 1) % self.capacity
+        return slot
+
+    def acquire(self, state):
+        stateId = self.ids.get(state)
+        if stateId is None:
+            stateId = self.freeIds.pop()
+            self.ids[state] = stateId
+            self.states[stateId] = state
+        self.references[stateId] += 1
+        return stateId
+
+    def release(self, stateId):
+        self.references[stateId] -= 1
+        if self.references[stateId] == 0:
+            del self.ids[self.states[stateId]]
+            self.states[stateId] = None
+            self.freeIds.append(stateId)
+
+    def getTransition(self, slot):
+        """
+          (state, action, reward, nextState) stored in slot
+        """
+        return (self.states[self.stateIds[slot]], self.actionIndex.getState(self.actionIds[slot]),
+                self.rewards[slot], self.states[self.nextStateIds[slot]])
+
+    def sample(self, batchSize):
+        """
+          batchSize slots drawn uniformly, with replacement
+        """
+        size = self.size
+        return [int(random.random() * size) for _ in range(batchSize)]
+
+    def getWeights(self, slots, beta):
+        """
+          Importance-sampling weights of sampled slots; uniform sampling
+          needs no correction
+        """
+        return [1.0] * len(slots)
+
+    def updatePriority(self, slot, error):
+        pass
+
+
+class SumTree:
+    """
+      Priorities of capacity slots in one array laid out as a binary
+      heap: leaves at [capacity, 2 * capacity), every inner node i the sum
+      (or, in the min tree, the minimum) of nodes 2i and 2i + 1.  Setting
+      a priority and finding the slot at a prefix sum take O(log n).
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.sums = array('d', bytes(8 * 2 * capacity))
+        self.mins = array('d', [float('inf')] * (2 * capacity))
+
+    def total(self):
+        return self.sums[1]
+
+    def minimum(self):
+        return self.mins[1]
+
+    def get(self, slot):
+        return self.sums[self.capacity + slot]
+
+    def set(self, slot, priority):
+        sums, mins = self.sums, self.mins
+        node = self.capacity + slot
+        sums[node] = priority
+        mins[node] = priority
+        node //= 2
+        while node >= 1:
+            left, right = 2 * node, 2 * node + 1
+            sums[node] = sums[left] + sums[right]
+            mins[node] = mins[left] if mins[left] < mins[right] else mins[right]
+            node //= 2
+
+    def find(self, prefix):
+        """
+          The slot whose leaf covers prefix in the running sum of leaves
+        """
+        sums = self.sums
+        node = 1
+        while node < self.capacity:
+            left = 2 * node
+            if prefix < sums[left] or sums[left + 1] <= 0.0:
+                node = left
+            else:
+                prefix -= sums[left]
+                node = left + 1
+        return node - self.capacity
+
+
+class PrioritizedReplayMemory(ReplayMemory):
+    """
+      Replay memory that samples a transition with probability
+      proportional to (|TD error| + epsilon) ** exponent, as kept in a
+      SumTree.  New transitions get the largest priority so far, so
+      each is replayed at least once soon.  getWeights gives the
+      importance-sampling weights (min P / P(i)) ** beta that undo the
+      bias of sampling by priority.
+    """
+
+    def __init__(self, capacity, actions=(), exponent=0.6, epsilon=1e-3):
+        ReplayMemory.__init__(self, capacity, actions)
+        self.exponent = exponent
+        self.epsilon = epsilon
+        self.tree = SumTree(capacity)
+        self.maxPriority = 1.0
+
+    def push(self, state, action, reward, nextState):
+        slot = ReplayMemory.push(self, state, action, reward, nextState)
+        self.tree.set(slot, self.maxPriority)
+        return slot
+
+    def sample(self, batchSize):
+        """
+          batchSize slots drawn by priority, one from each of batchSize
+          equal segments of the total priority
+        """
+        tree = self.tree
+        segment = tree.total() / batchSize
+        return [tree.find((i + random.random()) * segment) for i in range(batchSize)]
+
+    def getWeights(self, slots, beta):
+        tree = self.tree
+        minimum = tree.minimum()
+        return [(minimum / tree.get(slot)) ** beta for slot in slots]
+
+    def updatePriority(self, slot, error):
+        if error is None:
+            return
+        priority = (abs(error) + self.epsilon) ** self.exponent
+        self.maxPriority = max(self.maxPriority, priority)
+        self.tree.set(slot, priority)
@@ -0,0 +1,258 @@
+"""
+Hyperparameter sweeps for the learning agents of main.py.
+
+A sweep plays one trial per point of a search space, spread over a pool
+of worker processes.  Each trial is an ordinary main.py command: the
+point is passed as agent args (-o), numTraining as -x.  Trials train in
+segments, so that a learning curve point (the average training reward
+of the segment) can be written after each one, then play the test
+games.  Every curve point and final result is appended to the results
+file as one JSON line as soon as it is known.
+
+    python sweep.py -l classic -a QAgent -s "alpha=0.1|0.5;epsilon=0.05|0.2" -w 4
+    python sweep.py -a QAgent -s "alpha=0.05:0.9;numTraining=100:500" -t 20 --earlyStop
+"""
+import itertools
+import json
+import math
+import optparse
+import random
+import sys
+
+import main
+import util
+
+
+def parseSpace(string):
+    """
+    Parses a search space such as "alpha=0.1|0.5;epsilon=0.01:0.3" into
+    a list of (name, values) for discrete choices and (name, (low, high))
+    for ranges sampled uniformly.
+    """
+    space = []
+    for piece in string.split(';'):
+        if not piece.strip():
+            continue
+        if '=' not in piece:
+            raise Exception('Search space entry not understood: ' + piece)
+        name, values = piece.split('=', 1)
+        name = name.strip()
+        if ':' in values:
+            low, high = values.split(':')
+            space.append((name, (low.strip(), high.strip())))
+        else:
+            space.append((name, [value.strip() for value in values.split('|')]))
+    return space
+
+
+def isRange(values):
+    return isinstance(values, tuple)
+
+
+def parseNumber(string):
+    try:
+        return int(string)
+    except ValueError:
+        return float(string)
+
+
+def sampleValue(rand, values):
+    if not isRange(values):
+        return rand.choice(values)
+    low, high = [parseNumber(value) for value in values]
+    if isinstance(low, int) and isinstance(high, int):
+        return str(rand.randint(low, high))
+    return '%.4g' % rand.uniform(low, high)
+
+
+def getPoints(space, trials, seed=None):
+    """
+    The points of a grid search, the cartesian product of every choice,
+    or, if the space has ranges or trials is given, trials random points.
+    """
+    if trials is None and any(isRange(values) for _, values in space):
+        raise Exception('Search spaces with ranges need a number of trials (-t)')
+    if trials is None:
+        names = [name for name, _ in space]
+        return [dict(zip(names, point)) for point in itertools.product(*[values for _, values in space])]
+    rand = random.Random(seed)
+    return [dict((name, sampleValue(rand, values)) for name, values in space) for _ in range(trials)]
+
+
+def getTrialArgv(options, point):
+    """
+    The main.py command line of the trial at point
+    """
+    point = dict(point)
+    numTraining = int(point.pop('numTraining', options.numTraining))
+    agentArgs = [options.agentArgs] if options.agentArgs else []
+    agentArgs += ['%s=%s' % (name, value) for name, value in sorted(point.items())]
+    argv = ['-q', '--fastTraining', '-l', options.layout, '-a', options.agent,
+            '-x', str(numTraining), '-n', str(numTraining + options.numTest)]
+    if agentArgs:
+        argv += ['-o', ','.join(agentArgs)]
+    return argv
+
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+class Sweep:
+    """
+    What the trials of a sweep share between processes: the results
+    file, checkpoint values reported so far (for early stopping) and a
+    lock around both.  Created with a multiprocessing Manager, so that
+    it can be passed to the workers.
+    """
+
+    def __init__(self, manager, resultsFile, earlyStop=False, minTrials=3):
+        self.lock = manager.Lock()
+        self.progress = manager.dict()
+        self.resultsFile = resultsFile
+        self.earlyStop = earlyStop
+        self.minTrials = minTrials
+
+    def write(self, record):
+        with self.lock:
+            f = open(self.resultsFile, 'a')
+            try:
+                f.write(json.dumps(record) + '\n')
+            finally:
+                f.close()
+
+    def shouldStop(self, checkpoint, value):
+        """
+        Reports value at checkpoint and says whether the trial is clearly
+        losing: below the median of at least minTrials earlier trials at
+        the same checkpoint (the median stopping rule).
+        """
+        with self.lock:
+            values = self.progress.get(checkpoint, [])
+            self.progress[checkpoint] = values + [value]
+        return self.earlyStop and len(values) >= self.minTrials and value < median(values)
+
+
+def runTrial(job):
+    """
+    Worker of runSweep: plays one trial with main.readCommand and
+    main.runGames, training in checkpoints segments.
+    """
+    index, point, argv, seed, checkpoints, sweep = job
+    random.seed(seed)
+    util.mutePrint()
+    try:
+        args = main.readCommand(argv, seed, seeds=1)
+        del args['seeds']
+        agent = args['agent']
+        numTraining = args.get('numTraining', 0)
+        numTest = args['numGames'] - numTraining
+        segment = max(1, int(math.ceil(numTraining / float(max(1, checkpoints)))))
+
+        played = 0
+        stopped = False
+        while played < numTraining:
+            episodes = min(segment, numTraining - played)
+            before = agent.accumTrainRewards
+            main.runGames(**dict(args, numGames=episodes, numTraining=episodes))
+            played += episodes
+            value = (agent.accumTrainRewards - before) / episodes
+            sweep.write({'trial': index, 'params': point, 'episodes': played, 'averageReward': value})
+            if played < numTraining and sweep.shouldStop(played, value):
+                stopped = True
+                break
+
+        scores = []
+        if not stopped:
+            games = main.runGames(**dict(args, numGames=numTest, numTraining=0))
+            scores = [game.state.getScore() for game in games]
+    finally:
+        util.unmutePrint()
+
+    result = {'trial': index, 'params': point, 'episodes': played, 'stopped': stopped, 'scores': scores,
+              'averageScore': sum(scores) / float(len(scores)) if scores else None}
+    sweep.write(result)
+    return result
+
+
+def formatParams(params):
+    return ' '.join('%s=%s' % item for item in sorted(params.items()))
+
+
+def runSweep(options):
+    import multiprocessing
+    seed = main.FIXED_SEED if options.fixRandomSeed else None
+    points = getPoints(parseSpace(options.space), options.trials, seed)
+    manager = multiprocessing.Manager()
+    sweep = Sweep(manager, options.resultsFile, options.earlyStop)
+    jobs = [(index, point, getTrialArgv(options, point), main.deriveSeed(seed, index), options.checkpoints, sweep)
+            for index, point in enumerate(points)]
+
+    print('Running %d trials on %d workers, results in %s' % (len(jobs), options.workers, options.resultsFile))
+    pool = multiprocessing.Pool(max(1, min(options.workers, len(jobs))))
+    results = []
+    try:
+        for result in pool.imap_unordered(runTrial, jobs):
+            results.append(result)
+            params = formatParams(result['params'])
+            if result['stopped']:
+                print('Trial %d (%s) stopped after %d episodes' % (result['trial'], params, result['episodes']))
+            else:
+                print('Trial %d (%s): Average Score: %.1f' % (result['trial'], params, result['averageScore']))
+    finally:
+        pool.close()
+        pool.join()
+        manager.shutdown()
+
+    finished = [result for result in results if not result['stopped']]
+    if finished:
+        best = max(finished, key=lambda result: result['averageScore'])
+        print('Best: trial %d (%s): Average Score: %.1f' %
+              (best['trial'], formatParams(best['params']), best['averageScore']))
+    return results
+
+
+def readCommand(argv):
+    parser = optparse.OptionParser('python sweep.py <options>')
+    parser.add_option('-s', '--space', dest='space',
+                      help='Search space, e.g. "alpha=0.1|0.5;epsilon=0.01:0.3": | separates choices, '
+                           ': gives a range sampled uniformly')
+    parser.add_option('-t', '--trials', dest='trials', type='int', default=None,
+                      help='Number of random trials [Default: grid search over every choice]')
+    parser.add_option('-l', '--layout', dest='layout', default='classic',
+                      help=main.default('the LAYOUT_FILE of the trials'))
+    parser.add_option('-a', '--agent', dest='agent', default='QAgent',
+                      help=main.default('the agent TYPE of the trials'))
+    parser.add_option('-o', '--agentArgs', dest='agentArgs', default=None,
+                      help='Agent args shared by every trial, e.g. "abstraction=PositionAbstraction"')
+    parser.add_option('-x', '--numTraining', dest='numTraining', type='int', default=300,
+                      help=main.default('Training episodes of a trial, unless numTraining is swept'))
+    parser.add_option('-n', '--numTest', dest='numTest', type='int', default=10,
+                      help=main.default('Test games of a trial'))
+    parser.add_option('-c', '--checkpoints', dest='checkpoints', type='int', default=10,
+                      help=main.default('Learning curve points (and early stopping checks) per trial'))
+    parser.add_option('-e', '--earlyStop', dest='earlyStop', action='store_true', default=False,
+                      help='Stop trials whose learning curve falls below the median of earlier trials')
+    parser.add_option('-w', '--workers', dest='workers', type='int', default=1,
+                      help=main.default('Number of processes running trials'))
+    parser.add_option('-r', '--results', dest='resultsFile', default='sweep-results.jsonl',
+                      help=main.default('File the learning curves and results are appended to'))
+    parser.add_option('-f', '--fixRandomSeed', dest='fixRandomSeed', action='store_true', default=False,
+                      help='Derive the random points and the seed of every trial from a fixed seed')
+
+    options, otherjunk = parser.parse_args(argv)
+    if len(otherjunk) != 0:
+        raise Exception('Command line input not understood: ' + str(otherjunk))
+    if options.space is None:
+        raise Exception('A search space (-s) is required')
+    if options.numTest < 1:
+        raise Exception('Trials are ranked by their test games: -n must be at least 1')
+    return options
+
+
+if __name__ == '__main__':
+    runSweep(readCommand(sys.argv[1:]))
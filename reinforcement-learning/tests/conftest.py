@@ -0,0 +1,25 @@
+import os
+import sys
+
+import pytest
+
+# the modules of this project import each other as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import gridworld  # noqa: E402
+import qlearningAgents  # noqa: E402
+import qTables  # noqa: E402
+
+
+@pytest.fixture(params=['numpy', 'python'])
+def backend(request, monkeypatch):
+    """
+    Runs a test once with NumPy, if it is installed, and once with the
+    pure-Python fallbacks.
+    """
+    if request.param == 'numpy':
+        pytest.importorskip('numpy')
+    else:
+        for module in (gridworld, qlearningAgents, qTables):
+            monkeypatch.setattr(module, 'numpy', None)
+    return request.param
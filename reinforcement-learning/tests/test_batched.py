@@ -0,0 +1,62 @@
+import random
+
+import pytest
+
+import gridworld
+import qlearningAgents
+import qTables
+
+
+def makeAgent(grid, batchSize=16):
+    environment = gridworld.BatchedGridworldEnvironment(grid, batchSize)
+    return environment, qlearningAgents.BatchedQLearningAgent(environment, epsilon=0.3, alpha=0.5, gamma=0.9)
+
+
+def testBatchedTraining(backend):
+    random.seed(0)
+    grid = gridworld.getBookGrid()
+    environment, agent = makeAgent(grid)
+    assert (environment.arrays is not None) == (backend == 'numpy')
+    samples = agent.train(200)
+    assert environment.episodes >= 200
+    assert samples % environment.batchSize == 0
+    assert agent.getPolicy((0, 2)) == 'east'
+    assert agent.getValue((3, 2)) > 0.5
+
+
+def testBatchedPathsAgree(monkeypatch):
+    numpy = pytest.importorskip('numpy')
+    grid = gridworld.getBookGrid()
+    grid.setNoise(0.3)
+    vectorized, vectorizedAgent = makeAgent(grid)
+    with monkeypatch.context() as patch:
+        for module in (gridworld, qlearningAgents, qTables):
+            patch.setattr(module, 'numpy', None)
+        looped, loopedAgent = makeAgent(grid)
+    assert vectorized.arrays is not None and looped.arrays is None
+
+    rand = random.Random(0)
+    for _ in range(500):
+        stateIds = looped.getStateIds()
+        assert vectorized.getStateIds().tolist() == stateIds
+        actions = [rand.randrange(len(looped.getPossibleActions(stateId))) for stateId in stateIds]
+        draws = [rand.random() for _ in stateIds]
+        _, nextStateIds, rewards = looped.step(actions, draws)
+        _, vectorizedNextStateIds, vectorizedRewards = vectorized.step(numpy.array(actions), draws)
+        assert vectorizedNextStateIds.tolist() == nextStateIds
+        assert vectorizedRewards.tolist() == pytest.approx(rewards)
+        loopedAgent.updateBatch(stateIds, actions, nextStateIds, rewards)
+        vectorizedAgent.updateBatch(numpy.array(stateIds), numpy.array(actions), vectorizedNextStateIds,
+                                    vectorizedRewards)
+    assert vectorized.episodes == looped.episodes > 0
+
+    loopedValues = dict(loopedAgent.stateActionPair.items())
+    assert dict(vectorizedAgent.stateActionPair.items()) == pytest.approx(loopedValues)
+    assert any(loopedValues.values())
+
+    # greedy actions, where the best action is unique
+    loopedAgent.epsilon = vectorizedAgent.epsilon = 0.0
+    stateIds = [i for i, cells in enumerate(loopedAgent.cells)
+                if len(set(loopedAgent.stateActionPair.getCellValues(cells))) == len(cells) > 1]
+    assert stateIds
+    assert vectorizedAgent.getActions(numpy.array(stateIds)).tolist() == loopedAgent.getActions(stateIds)
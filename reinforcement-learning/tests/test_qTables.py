@@ -0,0 +1,32 @@
+import gridworld
+import qTables
+import valueIterationAgents
+
+
+def testArrayQTableGrows(backend):
+    table = qTables.ArrayQTable(actions=('north',))
+    for i in range(10):
+        table.setQValue(i, 'north', float(i))
+    table.setQValue(3, 'exit', -1.0)
+    assert [table.getQValue(i, 'north') for i in range(10)] == [float(i) for i in range(10)]
+    assert table.getQValue(3, 'exit') == -1.0
+    assert table.getQValue(4, 'exit') == 0.0
+    assert table.getQValue('unseen', 'north') == 0.0
+    assert len(table) == 11
+    expected = {(i, 'north'): float(i) for i in range(10)}
+    expected[(3, 'exit')] = -1.0
+    assert dict(table.items()) == expected
+
+
+def testArrayQTableKeepsMDPStates(backend):
+    grid = gridworld.getBookGrid()
+    numStates = len(grid.compile())
+    table = qTables.ArrayQTable(grid.getStateIndex(), ('north', 'west', 'south', 'east', 'exit'))
+    table.setQValue('not a grid state', 'north', 1.0)
+    assert table.getQValue('not a grid state', 'north') == 1.0
+    assert len(grid.getStateIndex()) == numStates
+
+    grid.setNoise(0.3)
+    assert len(grid.compile()) == numStates
+    agent = valueIterationAgents.ValueIterationAgent(grid, iterations=10, backend='compiled')
+    assert agent.getValue((3, 2)) > 0
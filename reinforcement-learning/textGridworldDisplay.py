@@ -2,7 +2,7 @@ import math
 from functools import reduce
 from itertools import zip_longest
 from past.builtins import xrange
-from util import Counter
+import util
 
 
 class TextGridworldDisplay:
@@ -19,7 +19,7 @@ class TextGridworldDisplay:
     def displayValues(self, agent, currentState=None, message=None):
         if message is not None:
             print(message)
-        values = Counter()
+        values = util.SparseCounter()
         policy = {}
         states = self.gridworld.getStates()
         for state in states:
@@ -35,7 +35,7 @@ class TextGridworldDisplay:
     def displayQValues(self, agent, currentState=None, message=None):
         if message is not None:
             print(message)
-        qValues = util.Counter()
+        qValues = util.SparseCounter()
         states = self.gridworld.getStates()
         for state in states:
             for action in self.gridworld.getPossibleActions(state):
@@ -314,7 +314,7 @@ def wrap_always(text, width):
 # TEST OF DISPLAY CODE
 
 if __name__ == '__main__':
-    import gridworld, util
+    import gridworld
 
     grid = gridworld.getCliffGrid()
     grid.getStates()
@@ -426,6 +426,34 @@ class Counter(dict):
         return addend
 
 
+class SparseCounter(Counter):
+    """
+    A Counter whose reads never store anything: looking up a missing key
+    returns 0 but leaves the counter unchanged, so it only grows with the
+    keys that are actually assigned.
+
+    >>> a = SparseCounter()
+    >>> a['test']
+    0
+    >>> len(a)
+    0
+    >>> a['test'] += 1
+    >>> a['test']
+    1
+    """
+
+    __getitem__ = dict.__getitem__
+
+    def __missing__(self, idx):
+        return 0
+
+    def copy(self):
+        """
+        Returns a copy of the counter
+        """
+        return SparseCounter(dict.copy(self))
+
+
 def raiseNotDefined():
     fileName = inspect.stack()[1][1]
     line = inspect.stack()[1][2]
@@ -565,6 +593,77 @@ def matrixAsList(matrix, value=True):
     return cells
 
 
+class SingularSystemError(Exception):
+    """Raised by solveLinearSystem when a pivot vanishes."""
+    pass
+
+
+def solveLinearSystem(rows, b):
+    """
+    Solves A x = b for a sparse square matrix A stored as a list of
+    dicts, rows[i] = {column: coefficient}, by Gaussian elimination on
+    the diagonal.  Each step eliminates the variable whose row and column
+    have the fewest entries left (the Markowitz rule), which keeps the
+    fill-in low on grid-like systems.  Diagonal pivots in any order are
+    safe for a nonsingular M-matrix such as (I - gamma * P) in policy
+    evaluation; a pivot that vanishes raises SingularSystemError.  rows
+    and b are modified in place; returns x as a list.
+    """
+    n = len(rows)
+    columns = [set() for _ in range(n)]  # uneliminated rows with an entry in each column
+    for i, row in enumerate(rows):
+        for j in row:
+            columns[j].add(i)
+    eliminated = [False] * n
+
+    def cost(i):
+        return (len(rows[i]) - 1) * (len(columns[i]) - 1)
+
+    # Stale heap entries, whose cost has changed since, are skipped
+    heap = [(cost(i), i) for i in range(n)]
+    heapq.heapify(heap)
+    order = []
+    while heap:
+        entryCost, k = heapq.heappop(heap)
+        if eliminated[k] or entryCost != cost(k):
+            continue
+        pivotRow = rows[k]
+        pivot = pivotRow.get(k, 0.0)
+        if abs(pivot) <= 1e-12 * sum([abs(coefficient) for coefficient in pivotRow.values()]):
+            raise SingularSystemError('Singular system: zero pivot in row %d' % k)
+        eliminated[k] = True
+        order.append(k)
+        for j in pivotRow:
+            columns[j].discard(k)
+        for i in columns[k]:
+            row = rows[i]
+            factor = row.pop(k) / pivot
+            for j, coefficient in pivotRow.items():
+                if j == k:
+                    continue
+                if j not in row:
+                    row[j] = 0.0
+                    columns[j].add(i)
+                row[j] -= factor * coefficient
+            b[i] -= factor * b[k]
+        touched = set(columns[k])
+        touched.update(pivotRow)
+        touched.discard(k)
+        columns[k] = set()
+        for i in touched:
+            heapq.heappush(heap, (cost(i), i))
+
+    # Every row now only holds columns eliminated after its own
+    x = [0.0] * n
+    for k in reversed(order):
+        total = b[k]
+        for j, coefficient in rows[k].items():
+            if j != k:
+                total -= coefficient * x[j]
+        x[k] = total / rows[k][k]
+    return x
+
+
 def lookup(name, namespace):
     """
     Get a method or class from any imported module from its name.
@@ -1,3 +1,5 @@
+import time
+
 import util
 
 from learningAgents import ValueEstimationAgent
@@ -14,7 +16,8 @@ class ValueIterationAgent(ValueEstimationAgent):
         discount factor.
     """
 
-    def __init__(self, mdp, discount=0.9, iterations=100):
+    def __init__(self, mdp, discount=0.9, iterations=100, backend='python', tolerance=None,
+                 update='jacobi', ordering='default'):
         """
           Your value iteration agent should take an mdp on
           construction, run the indicated number of iterations
@@ -26,24 +29,177 @@ class ValueIterationAgent(ValueEstimationAgent):
               mdp.getTransitionStatesAndProbs(state, action)
               mdp.getReward(state, action, nextState)
               mdp.isTerminal(state)
+
+          backend selects how the sweeps are run:
+              'python'   - query the mdp for every state and action on every sweep
+              'compiled' - compile the mdp once (see mdp.CompiledMDP) and
+                           sweep over its integer-indexed transition rows
+
+          If tolerance is given, iteration stops early once the Bellman
+          residual max_s |V_k+1(s) - V_k(s)| drops below it; iterations
+          is then only an upper bound on the number of sweeps.
+
+          update selects how a sweep uses the values:
+              'jacobi'       - every backup reads the previous sweep's values
+              'gauss-seidel' - values are overwritten in place, so later
+                               backups in a sweep already see earlier ones
+
+          ordering is the order states are visited in each sweep, which
+          matters for 'gauss-seidel': 'default' (mdp.getStates() order),
+          'reverse', or 'exits' (closest to a terminal state first).
         """
         self.mdp = mdp
         self.discount = discount
         self.iterations = iterations
-        self.values = util.Counter()  # A Counter is a dict with default 0
+        self.backend = backend
+        self.tolerance = tolerance
+        self.update = update
+        self.ordering = ordering
+        self.residuals = []  # Bellman residual of every sweep run
+        self.values = util.SparseCounter()  # A Counter is a dict with default 0
         self.actions = {state: None for state in self.mdp.getStates()}
-        # Write value iteration code here
+        if update not in ('jacobi', 'gauss-seidel'):
+            raise Exception('Unknown value iteration update: ' + str(update))
+        if backend == 'python':
+            self.runValueIteration()
+        elif backend == 'compiled':
+            self.runCompiledValueIteration()
+        else:
+            raise Exception('Unknown value iteration backend: ' + str(backend))
+
+    def sortStates(self, states, compiled=None):
+        """
+          Returns states in the order a sweep should back them up.
+        """
+        if self.ordering == 'default':
+            return list(states)
+        if self.ordering == 'reverse':
+            return list(reversed(states))
+        if self.ordering == 'exits':
+            if compiled is None:
+                compiled = self.mdp.compile()
+            distances = exitDistances(compiled)
+            return sorted(states, key=lambda state: distances[compiled.getStateId(state)])
+        raise Exception('Unknown state ordering: ' + str(self.ordering))
+
+    def runValueIteration(self):
+        states = self.sortStates(self.mdp.getStates())
+        inPlace = self.update == 'gauss-seidel'
         for _ in range(self.iterations):
-            next_values = util.Counter()
-            for state in self.mdp.getStates():
+            next_values = self.values if inPlace else util.SparseCounter()
+            residual = 0.0
+            for state in states:
                 max_value = float('-inf')
                 for action in self.mdp.getPossibleActions(state):
                     v = self.computeQValueFromValues(state, action)
                     if v > max_value:
                         max_value = v
-                        next_values[state] = v
                         self.actions[state] = action
+                if max_value > float('-inf'):
+                    residual = max(residual, abs(max_value - self.values[state]))
+                    next_values[state] = max_value
             self.values = next_values
+            if self.hasConverged(residual):
+                break
+
+    def runCompiledValueIteration(self):
+        """
+          Same sweeps as runValueIteration, but every Bellman backup is a
+          sparse row-times-vector product over the compiled transition
+          table followed by a max over the state's actions.  Jacobi
+          sweeps are run on NumPy arrays when NumPy is installed.
+        """
+        compiled = self.mdp.compile()
+        arrays = compiled.getArrays() if self.update == 'jacobi' else None
+        if arrays is not None:
+            self.runVectorizedValueIteration(compiled, arrays)
+            return
+        discount = self.discount
+        numStates = len(compiled)
+        order = [compiled.getStateId(state) for state in self.sortStates(compiled.states, compiled)]
+        rows = [(i, compiled.rewards[i], compiled.successors[i]) for i in order if compiled.actions[i]]
+        inPlace = self.update == 'gauss-seidel'
+        bestActions = [None] * numStates
+        values = [0.0] * numStates
+        for _ in range(self.iterations):
+            next_values = values if inPlace else [0.0] * numStates
+            residual = 0.0
+            for i, rewards, successors in rows:
+                max_value = float('-inf')
+                for k in range(len(rewards)):
+                    v = rewards[k] + discount * sum([prob * values[j] for j, prob in successors[k]])
+                    if v > max_value:
+                        max_value = v
+                        bestActions[i] = k
+                residual = max(residual, abs(max_value - values[i]))
+                next_values[i] = max_value
+            values = next_values
+            if self.hasConverged(residual):
+                break
+
+        self.values = util.SparseCounter()
+        for i, state in enumerate(compiled.states):
+            if compiled.actions[i]:
+                self.values[state] = values[i]
+            if bestActions[i] is not None:
+                self.actions[state] = compiled.actions[i][bestActions[i]]
+
+    def runVectorizedValueIteration(self, compiled, arrays):
+        """
+          Jacobi sweeps over the arrays of compiled.getArrays(): the
+          Q-values of all (state, action) rows in one sparse product, then
+          the max over each state's rows.
+        """
+        import numpy
+        pairStates, pairRewards, successorRows, nextIds, probs, stateStarts, activeIds = arrays
+        numPairs = len(pairRewards)
+        values = numpy.zeros(len(compiled))
+        qValues = maxValues = None
+        if len(activeIds):
+            for _ in range(self.iterations):
+                qValues = pairRewards + self.discount * numpy.bincount(successorRows, probs * values[nextIds], numPairs)
+                maxValues = numpy.maximum.reduceat(qValues, stateStarts)
+                residual = float(numpy.abs(maxValues - values[activeIds]).max())
+                values = numpy.zeros(len(compiled))
+                values[activeIds] = maxValues
+                if self.hasConverged(residual):
+                    break
+
+        self.values = util.SparseCounter()
+        if qValues is None:
+            return
+        ends = stateStarts.tolist()[1:] + [numPairs]
+        for i, start, end, value in zip(activeIds.tolist(), stateStarts.tolist(), ends, maxValues.tolist()):
+            state = compiled.states[i]
+            self.values[state] = value
+            self.actions[state] = compiled.actions[i][int(qValues[start:end].argmax())]
+
+    def hasConverged(self, residual):
+        """
+          Records the residual of the sweep just run and tells whether
+          the tolerance (if any) has been reached.
+        """
+        self.residuals.append(residual)
+        return self.tolerance is not None and residual < self.tolerance
+
+    def getSweeps(self):
+        """
+          Number of sweeps actually run (at most self.iterations).
+        """
+        return len(self.residuals)
+
+    def getPolicyLossBound(self):
+        """
+          Upper bound on max_s V*(s) - V^pi(s) for the stored policy pi.
+
+          The policy recorded during the last sweep is greedy with respect
+          to the values of the sweep before, V_k-1.  If the residual r of
+          that sweep is |V_k-1 - V_k-2|, then pi loses at most
+          2 * gamma * r / (1 - gamma) against the optimal policy.
+        """
+        if len(self.residuals) < 2 or self.discount >= 1:
+            return float('inf')
+        return 2 * self.discount * self.residuals[-2] / (1 - self.discount)
 
     def getValue(self, state):
         """
@@ -83,5 +239,254 @@ class ValueIterationAgent(ValueEstimationAgent):
         return self.computeQValueFromValues(state, action)
 
 
+class PrioritizedSweepingValueIterationAgent(ValueIterationAgent):
+    """
+        * Please read learningAgents.py before reading this.*
+
+        A PrioritizedSweepingValueIterationAgent takes a Markov decision
+        process (see mdp.py) on initialization and runs prioritized
+        sweeping value iteration for a given number of state updates
+        using the supplied discount factor.
+
+        Instead of backing up every state on every sweep, it keeps the
+        states in a priority queue keyed on their Bellman error and only
+        backs up the state that is furthest off; the predecessors of an
+        updated state are then re-queued if their own error exceeds theta.
+    """
+
+    def __init__(self, mdp, discount=0.9, iterations=100, theta=1e-5):
+        """
+          iterations is the maximum number of single-state updates.
+        """
+        self.theta = theta
+        self.updates = 0
+        ValueIterationAgent.__init__(self, mdp, discount, iterations, backend='compiled')
+
+    def runCompiledValueIteration(self):
+        compiled = self.mdp.compile()
+        discount = self.discount
+        numStates = len(compiled)
+        rewards = compiled.rewards
+        successors = compiled.successors
+        values = [0.0] * numStates
+
+        def bestQValue(i):
+            return max([rewards[i][k] + discount * sum([prob * values[j] for j, prob in successors[i][k]])
+                        for k in range(len(rewards[i]))])
+
+        predecessors = [set() for _ in range(numStates)]
+        for i in range(numStates):
+            for row in successors[i]:
+                for j, prob in row:
+                    if prob > 0:
+                        predecessors[j].add(i)
+
+        # The queue may hold stale duplicates of a state; only the first
+        # one popped after it was (re)queued is used.
+        queue = util.PriorityQueue()
+        queued = set()
+        for i in range(numStates):
+            if compiled.actions[i]:
+                queue.push(i, -abs(values[i] - bestQValue(i)))
+                queued.add(i)
+
+        while self.updates < self.iterations and not queue.isEmpty():
+            i = queue.pop()
+            if i not in queued:
+                continue
+            queued.remove(i)
+            values[i] = bestQValue(i)
+            self.updates += 1
+            for p in predecessors[i]:
+                if not compiled.actions[p]:
+                    continue
+                error = abs(values[p] - bestQValue(p))
+                if error > self.theta:
+                    queue.push(p, -error)
+                    queued.add(p)
+
+        self.values = util.SparseCounter()
+        for i, state in enumerate(compiled.states):
+            if compiled.actions[i]:
+                self.values[state] = values[i]
+                qValues = [rewards[i][k] + discount * sum([prob * values[j] for j, prob in successors[i][k]])
+                           for k in range(len(rewards[i]))]
+                self.actions[state] = compiled.actions[i][qValues.index(max(qValues))]
+
+
+class PolicyIterationAgent(ValueIterationAgent):
+    """
+        * Please read learningAgents.py before reading this.*
+
+        A PolicyIterationAgent takes a Markov decision process
+        (see mdp.py) on initialization and alternates policy
+        evaluation with greedy policy improvement until the policy
+        stops changing (or for at most the given number of iterations).
+
+        By default each evaluation is exact: a sparse solve of
+        (I - gamma * P_pi) V = R_pi over the compiled transitions, or, if
+        that has no unique solution (gamma = 1 and a policy that never
+        exits from some state), as many in-place sweeps as there are
+        states.  With
+        evaluationSweeps = k it is instead modified policy iteration,
+        which approximates V_pi with k in-place sweeps and stops once the
+        policy is stable and the last sweep moved no value by more than
+        tolerance.
+    """
+
+    def __init__(self, mdp, discount=0.9, iterations=100, evaluationSweeps=None, tolerance=1e-6):
+        self.evaluationSweeps = evaluationSweeps
+        self.policyIterations = 0
+        self.evaluationTime = 0.0
+        self.improvementTime = 0.0
+        ValueIterationAgent.__init__(self, mdp, discount, iterations, backend='compiled', tolerance=tolerance)
+
+    def runCompiledValueIteration(self):
+        compiled = self.mdp.compile()
+        discount = self.discount
+        numStates = len(compiled)
+        rewards = compiled.rewards
+        successors = compiled.successors
+        policy = [0 if compiled.actions[i] else None for i in range(numStates)]
+        values = [0.0] * numStates
+
+        for _ in range(self.iterations):
+            startTime = time.time()
+            solved = self.solvePolicy(compiled, policy) if self.evaluationSweeps is None else None
+            if solved is not None:
+                values = solved
+                residual = 0.0
+            else:
+                residual = self.sweepPolicy(compiled, policy, values, self.evaluationSweeps or numStates)
+            self.evaluationTime += time.time() - startTime
+
+            startTime = time.time()
+            stable = True
+            for i in range(numStates):
+                if policy[i] is None:
+                    continue
+                qValues = [rewards[i][k] + discount * sum([prob * values[j] for j, prob in successors[i][k]])
+                           for k in range(len(rewards[i]))]
+                best = qValues.index(max(qValues))
+                # Only switch on a clear improvement, so ties (up to rounding
+                # error in the evaluation) cannot make the policy cycle
+                current = qValues[policy[i]]
+                if qValues[best] - current > 1e-9 * (1 + abs(current)):
+                    policy[i] = best
+                    stable = False
+            self.improvementTime += time.time() - startTime
+            self.policyIterations += 1
+            if self.hasConverged(residual) and stable:
+                break
+
+        self.values = util.SparseCounter()
+        for i, state in enumerate(compiled.states):
+            if policy[i] is not None:
+                self.values[state] = values[i]
+                self.actions[state] = compiled.actions[i][policy[i]]
+
+    def solvePolicy(self, compiled, policy):
+        """
+          Exact V_pi from the sparse linear system (I - gamma * P_pi) V = R_pi,
+          or None if it has no unique solution: with gamma = 1, when the
+          policy is improper (some state never reaches a terminal state).
+          Evaluation then falls back to sweeps.
+        """
+        if self.discount >= 1 and not isProperPolicy(compiled, policy):
+            return None
+        rows = []
+        b = []
+        for i in range(len(compiled)):
+            row = {i: 1.0}
+            k = policy[i]
+            if k is None:
+                b.append(0.0)
+            else:
+                for j, prob in compiled.successors[i][k]:
+                    row[j] = row.get(j, 0.0) - self.discount * prob
+                b.append(compiled.rewards[i][k])
+            rows.append(row)
+        try:
+            return util.solveLinearSystem(rows, b)
+        except util.SingularSystemError:
+            return None
+
+    def sweepPolicy(self, compiled, policy, values, sweeps):
+        """
+          Approximates V_pi with in-place sweeps over values; returns the
+          largest change made by the last sweep.
+        """
+        discount = self.discount
+        residual = 0.0
+        for _ in range(sweeps):
+            residual = 0.0
+            for i in range(len(compiled)):
+                k = policy[i]
+                if k is None:
+                    continue
+                v = compiled.rewards[i][k] + discount * sum([prob * values[j] for j, prob in compiled.successors[i][k]])
+                residual = max(residual, abs(v - values[i]))
+                values[i] = v
+        return residual
+
+
+def isProperPolicy(compiled, policy):
+    """
+    Whether every state reaches a state with no actions with nonzero
+    probability when following policy (the action index of each state
+    id, None for terminal states), found by a breadth-first search
+    backwards from the terminal states.
+    """
+    numStates = len(compiled)
+    predecessors = [[] for _ in range(numStates)]
+    for i in range(numStates):
+        if policy[i] is not None:
+            for j, prob in compiled.successors[i][policy[i]]:
+                if prob > 0:
+                    predecessors[j].append(i)
+    reached = [policy[i] is None for i in range(numStates)]
+    queue = util.Queue()
+    for i in range(numStates):
+        if reached[i]:
+            queue.push(i)
+    while not queue.isEmpty():
+        j = queue.pop()
+        for i in predecessors[j]:
+            if not reached[i]:
+                reached[i] = True
+                queue.push(i)
+    return all(reached)
+
+
+def exitDistances(compiled):
+    """
+    Number of transitions from each state (by id) to the nearest state
+    with no actions, found by a breadth-first search backwards over the
+    compiled transition rows.  Unreachable states get infinity.
+    """
+    numStates = len(compiled)
+    predecessors = [set() for _ in range(numStates)]
+    for i in range(numStates):
+        for row in compiled.successors[i]:
+            for j, prob in row:
+                if prob > 0:
+                    predecessors[j].add(i)
+    distances = [float('inf')] * numStates
+    queue = util.Queue()
+    for i in range(numStates):
+        if not compiled.actions[i]:
+            distances[i] = 0
+            queue.push(i)
+    while not queue.isEmpty():
+        j = queue.pop()
+        for i in predecessors[j]:
+            if distances[i] == float('inf'):
+                distances[i] = distances[j] + 1
+                queue.push(i)
+    return distances
+
+
 # Abbreviation
 vI = ValueIterationAgent
+psVI = PrioritizedSweepingValueIterationAgent
+pI = PolicyIterationAgent